@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_wtf.csrf import CSRFProtect
 from werkzeug.middleware.proxy_fix import ProxyFix
+from db_pool import engine_options, prewarm_pool, detach_pool_after_fork
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -20,10 +21,7 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 # Database configuration
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    'pool_pre_ping': True,
-    "pool_recycle": 300,
-}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
 
 # CSRF protection
 csrf = CSRFProtect(app)
@@ -36,4 +34,7 @@ with app.app_context():
     import models  # noqa: F401
     db.create_all()
     logging.info("Database tables created")
+    # Open pooled connections before this worker takes traffic
+    detach_pool_after_fork(db.engine)
+    prewarm_pool(db.engine)
 
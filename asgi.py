@@ -0,0 +1,367 @@
+"""
+ASGI entry point for the chat and search APIs.
+
+Run with `uvicorn asgi:app`. JSON chat requests, their batch and streaming
+variants and /api/search are served on the event loop, with retrieval
+offloaded to a thread or process pool, so a worker can hold thousands of
+idle streaming connections while searches run. Every other request,
+including the form-posted /chat used by the demo page, is passed to the
+Flask app through asgiref's WSGI adapter.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+from main import app as flask_app
+from app import db
+from models import User
+from chat_service import answer_question, cached_answer, chat_payload, search_payload, store_answer
+from compliance_data import search_handbook
+from corpus_registry import corpus_registry, DEFAULT_TENANT
+from rate_limit import chat_admission
+from query_log import query_log
+
+MAX_BODY_BYTES = 64 * 1024
+MIN_QUESTION_LENGTH = 5
+MAX_QUESTION_LENGTH = 500
+MAX_BATCH_QUESTIONS = int(os.environ.get("CHAT_MAX_BATCH", "10"))
+HEARTBEAT_SECONDS = float(os.environ.get("CHAT_STREAM_HEARTBEAT", "15"))
+SEARCH_EXECUTOR = os.environ.get("ASGI_SEARCH_EXECUTOR", "thread")
+SEARCH_WORKERS = int(os.environ.get("ASGI_SEARCH_WORKERS", str(os.cpu_count() or 2)))
+WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+
+_executor: Optional[Executor] = None
+_wsgi_app = WsgiToAsgi(flask_app)
+_wsgi_slots: Optional[asyncio.Semaphore] = None
+
+
+class RequestError(Exception):
+    """A client error reported as a JSON error body."""
+
+    def __init__(self, status: int, message: str, headers: List[Tuple[bytes, bytes]] = ()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = list(headers)
+
+
+class ClientDisconnected(Exception):
+    """The client went away before sending its whole request."""
+
+
+def search_executor() -> Executor:
+    """Pool that runs CPU-bound retrieval off the event loop."""
+    global _executor
+    if _executor is None:
+        if SEARCH_EXECUTOR == "process":
+            # Forked workers inherit the loaded app modules and built-in index
+            context = (multiprocessing.get_context("fork")
+                       if "fork" in multiprocessing.get_all_start_methods() else None)
+            _executor = ProcessPoolExecutor(max_workers=SEARCH_WORKERS, mp_context=context)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+        logging.info(f"Retrieval offloaded to a {SEARCH_EXECUTOR} pool of {SEARCH_WORKERS} workers")
+    return _executor
+
+
+async def run_retrieval(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(search_executor(), function, *args)
+
+
+async def run_blocking(function, *args):
+    """Run short blocking I/O such as SQLite or database lookups on the default pool."""
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def answer_on_pool(question: str, tenant_id: str):
+    """Answer one question; returns the answer and whether it was cached."""
+    if SEARCH_EXECUTOR != "process":
+        return await run_retrieval(answer_question, question, tenant_id)
+    # Each forked worker would hold its own copy of the question cache, so
+    # keep the cache in this process and send only the search to the pool
+    cached, namespace, key_terms = await run_blocking(cached_answer, question, tenant_id)
+    if cached:
+        return cached, True
+    results = await run_retrieval(search_handbook, question, 1, tenant_id)
+    return await run_blocking(store_answer, question, results, namespace, key_terms), False
+
+
+def request_headers(scope) -> Dict[str, str]:
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+
+def read_session(headers: Dict[str, str]) -> dict:
+    """The signed Flask session from the request's cookie, or {} if there is none."""
+    cookie = parse_cookie(headers.get("cookie", "")).get(flask_app.config["SESSION_COOKIE_NAME"])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return {}
+    try:
+        return serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def tenant_for_user(user_id: Optional[str], email_verified: bool = False) -> str:
+    if not user_id:
+        return DEFAULT_TENANT
+    with flask_app.app_context():
+        user = db.session.get(User, user_id)
+        return corpus_registry.tenant_for_email(user.email if user else None, email_verified)
+
+
+def check_origin(headers: Dict[str, str]) -> None:
+    """
+    Refuse cross-site browser requests. These endpoints take JSON rather than
+    a CSRF-protected form, and browsers cannot send a cross-origin JSON POST
+    without a preflight, but the Origin check also covers same-site tricks.
+    """
+    origin = headers.get("origin")
+    host = headers.get("x-forwarded-host", headers.get("host", "")).split(",")[0].strip()
+    if origin and urlsplit(origin).netloc != host:
+        raise RequestError(403, "Cross-origin requests are not allowed.")
+
+
+async def read_json(scope, receive) -> dict:
+    headers = request_headers(scope)
+    check_origin(headers)
+    if headers.get("content-type", "").split(";")[0].strip() != "application/json":
+        raise RequestError(415, "Request body must be JSON.")
+
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        size += len(message.get("body", b""))
+        if size > MAX_BODY_BYTES:
+            raise RequestError(413, "Request body is too large.")
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+
+    try:
+        payload = json.loads(b"".join(chunks))
+    except ValueError:
+        raise RequestError(400, "Request body must be JSON.")
+    if not isinstance(payload, dict):
+        raise RequestError(400, "Request body must be a JSON object.")
+    return payload
+
+
+def parse_questions(payload: dict) -> List[str]:
+    """Questions from a {"question": ...} or {"questions": [...]} body."""
+    questions = payload["questions"] if "questions" in payload else [payload.get("question")]
+    if not isinstance(questions, list) or not questions:
+        raise RequestError(400, "Question is required.")
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise RequestError(400, f"At most {MAX_BATCH_QUESTIONS} questions per request.")
+
+    parsed = []
+    for question in questions:
+        if not isinstance(question, str) or not question.strip():
+            raise RequestError(400, "Question is required.")
+        question = question.strip()
+        if not MIN_QUESTION_LENGTH <= len(question) <= MAX_QUESTION_LENGTH:
+            raise RequestError(400, "Invalid question format.")
+        parsed.append(question)
+    return parsed
+
+
+async def admit(scope, headers: Dict[str, str], cost: int = 1) -> str:
+    """Apply chat admission control and return the caller's tenant."""
+    client_ip = scope["client"][0] if scope.get("client") else "unknown"
+    session = read_session(headers)
+    user_id = session.get("_user_id")
+    admission = await run_blocking(chat_admission.admit, client_ip, user_id, cost)
+    if admission.oversized:
+        raise RequestError(413, "Too many questions in one request. Please send fewer at a time.")
+    if not admission.allowed:
+        raise RequestError(429, "Too many questions. Please wait a moment and try again.",
+                           [(b"retry-after", str(admission.retry_after).encode())])
+    return await run_blocking(tenant_for_user, user_id, session.get("email_verified", False))
+
+
+async def send_json(send, status: int, payload: dict, headers: List[Tuple[bytes, bytes]] = ()) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def sse_event(event: str, payload: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+async def chat(scope, receive, send) -> None:
+    """POST /chat with a JSON body: answer one question."""
+    questions = parse_questions(await read_json(scope, receive))
+    if len(questions) != 1:
+        raise RequestError(400, "Use /chat/batch for more than one question.")
+    tenant_id = await admit(scope, request_headers(scope))
+    query_log.record(questions[0], tenant_id)
+    answer, cached = await answer_on_pool(questions[0], tenant_id)
+    await send_json(send, 200, chat_payload(questions[0], answer, cached))
+
+
+async def chat_batch(scope, receive, send) -> None:
+    """POST /chat/batch: answer several questions in one response, in order."""
+    questions = parse_questions(await read_json(scope, receive))
+    tenant_id = await admit(scope, request_headers(scope), len(questions))
+    for question in questions:
+        query_log.record(question, tenant_id)
+    answers = await asyncio.gather(*(answer_on_pool(question, tenant_id) for question in questions))
+    await send_json(send, 200, {
+        "success": True,
+        "answers": [chat_payload(question, answer, cached)
+                    for question, (answer, cached) in zip(questions, answers)]
+    })
+
+
+async def chat_stream(scope, receive, send) -> None:
+    """
+    POST /chat/stream: answer questions as server-sent events.
+    Each answer is sent as soon as it is ready, tagged with the index of its
+    question, followed by a final "done" event. Comment lines keep the
+    connection alive through proxies while answers are pending.
+    """
+    questions = parse_questions(await read_json(scope, receive))
+    tenant_id = await admit(scope, request_headers(scope), len(questions))
+    for question in questions:
+        query_log.record(question, tenant_id)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")],
+    })
+
+    pending = {
+        asyncio.ensure_future(answer_on_pool(question, tenant_id)): (index, question)
+        for index, question in enumerate(questions)
+    }
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        while pending:
+            done, _ = await asyncio.wait(set(pending) | {disconnected}, timeout=HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                return
+            if not done:
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                continue
+            for task in done:
+                index, question = pending.pop(task)
+                try:
+                    answer, cached = task.result()
+                    payload = chat_payload(question, answer, cached)
+                except Exception as e:
+                    logging.error(f"Streaming answer failed: {e}")
+                    payload = {"success": False, "question": question, "error": "Unable to answer question."}
+                payload["index"] = index
+                await send({"type": "http.response.body", "body": sse_event("answer", payload), "more_body": True})
+
+        await send({"type": "http.response.body", "body": sse_event("done", {"count": len(questions)})})
+    finally:
+        # Queued searches for a client that went away are dropped
+        for task in pending:
+            task.cancel()
+        disconnected.cancel()
+
+
+async def api_search(scope, receive, send) -> None:
+    """GET /api/search: the same ranked results as the Flask endpoint."""
+    params = parse_qs(scope["query_string"].decode("latin-1"))
+    query = params.get("q", [""])[0].strip()
+    if not query:
+        raise RequestError(400, "Query is required.")
+    try:
+        k = int(params.get("k", ["5"])[0])
+        offset = int(params.get("offset", ["0"])[0])
+    except ValueError:
+        k, offset = 5, 0
+
+    session = read_session(request_headers(scope))
+    tenant_id = await run_blocking(tenant_for_user, session.get("_user_id"), session.get("email_verified", False))
+    await send_json(send, 200, await run_retrieval(search_payload, query, k, offset, tenant_id))
+
+
+ROUTES = {
+    ("POST", "/chat/batch"): chat_batch,
+    ("POST", "/chat/stream"): chat_stream,
+    ("GET", "/api/search"): api_search,
+}
+
+
+def route_for(scope):
+    if scope["type"] != "http":
+        return None
+    if (scope["method"], scope["path"]) == ("POST", "/chat"):
+        # The demo page posts a CSRF-protected form, which Flask validates
+        content_type = request_headers(scope).get("content-type", "")
+        return chat if content_type.split(";")[0].strip() == "application/json" else None
+    return ROUTES.get((scope["method"], scope["path"]))
+
+
+async def serve_wsgi(scope, receive, send) -> None:
+    global _wsgi_slots
+    if _wsgi_slots is None:
+        _wsgi_slots = asyncio.Semaphore(WSGI_THREADS)
+    # asgiref runs WSGI calls on one shared thread unless each request gets
+    # its own context; the semaphore bounds how many run at once
+    async with _wsgi_slots:
+        async with ThreadSensitiveContext():
+            await _wsgi_app(scope, receive, send)
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            executor = search_executor()
+            if isinstance(executor, ProcessPoolExecutor):
+                # A process pool forks its workers on the first submit, not
+                # when it is created. Force that now, before any other thread
+                # exists that could hold a lock such as the corpus registry's
+                # across the fork and deadlock the child.
+                await asyncio.get_running_loop().run_in_executor(executor, os.getpid)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    handler = route_for(scope)
+    if handler is None:
+        await serve_wsgi(scope, receive, send)
+        return
+
+    try:
+        await handler(scope, receive, send)
+    except RequestError as e:
+        await send_json(send, e.status, {"success": False, "error": e.message}, e.headers)
+    except ClientDisconnected:
+        pass
@@ -0,0 +1,164 @@
+"""
+Chat answering and search ranking shared by the Flask routes and the ASGI
+entry point. Everything here is synchronous and CPU-bound; the ASGI app
+runs it on an executor so the event loop stays free for I/O.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Tuple
+
+from compliance_data import search_handbook, FALLBACK_SOURCE, PREDEFINED_QA
+from corpus_registry import corpus_registry, DEFAULT_TENANT
+from models import ChatMessage
+from question_cache import question_cache
+from query_log import query_log
+
+MAX_SEARCH_RESULTS = 50
+WARMUP_TOP_N = int(os.environ.get("WARMUP_TOP_N", "200"))
+WARMUP_BUDGET_SECONDS = float(os.environ.get("WARMUP_BUDGET_SECONDS", "5"))
+
+
+@dataclass(frozen=True)
+class WarmUpReport:
+    preloaded: int
+    candidates: int
+    seconds: float
+    budget_exhausted: bool
+
+
+# Result of this worker's boot-time warm-up, if it ran
+warm_up_report: Optional[WarmUpReport] = None
+
+
+def answer_question(question: str, tenant_id: str = DEFAULT_TENANT,
+                    record_stats: bool = True) -> Tuple[Optional[ChatMessage], bool]:
+    """
+    Answer a chat question from the tenant's corpus.
+    Returns the answer (None if nothing matched) and whether it was cached.
+    """
+    cached, namespace, key_terms = cached_answer(question, tenant_id, record_stats)
+    if cached:
+        return cached, True
+    return store_answer(question, search_handbook(question, tenant_id=tenant_id), namespace, key_terms), False
+
+
+def cached_answer(question: str, tenant_id: str = DEFAULT_TENANT,
+                  record_stats: bool = True) -> Tuple[Optional[ChatMessage], str, FrozenSet[str]]:
+    """
+    Stored answer for a near-duplicate question that asks about the same
+    vocabulary terms, if any, along with the cache namespace of the corpus
+    snapshot that was consulted and the question's terms in that snapshot.
+    """
+    corpus = corpus_registry.get(tenant_id)
+    key_terms = corpus.resolve_terms(question)
+    namespace = corpus.cache_namespace
+    return question_cache.lookup(question, namespace, key_terms, record_stats), namespace, key_terms
+
+
+def store_answer(question: str, results: List[ChatMessage], namespace: str,
+                 key_terms: FrozenSet[str]) -> Optional[ChatMessage]:
+    """
+    Pick the answer from search results and cache it unless it is the fallback.
+    The namespace must be the one cached_answer looked up, so an answer
+    searched while the corpus changed is never filed under the new version.
+    """
+    if not results:
+        return None
+    result = results[0]
+    if result.sources != [FALLBACK_SOURCE]:
+        question_cache.add(question, result, namespace, key_terms)
+    return result
+
+
+def chat_payload(question: str, answer: Optional[ChatMessage], cached: bool = False) -> dict:
+    """JSON body for one answered chat question."""
+    if answer is None:
+        return {
+            'success': False,
+            'question': question,
+            'error': 'No relevant information found.'
+        }
+
+    payload = {
+        'success': True,
+        'question': question,
+        'answer': answer.answer,
+        'sources': answer.sources or []
+    }
+    if cached:
+        payload['cached'] = True
+    return payload
+
+
+def search_payload(query: str, k: int = 5, offset: int = 0, tenant_id: str = DEFAULT_TENANT) -> dict:
+    """Top-k ranked sections and sentences for a query, as a JSON body."""
+    k = min(max(k, 1), MAX_SEARCH_RESULTS)
+    offset = max(offset, 0)
+    corpus = corpus_registry.get(tenant_id)
+
+    sections = [{
+        'title': shard.sections[section_id].title,
+        'page_number': shard.sections[section_id].page_number,
+        'source': shard.sources[section_id],
+        'score': round(score, 4)
+    } for shard, section_id, score, _ in corpus.top_sections(query, offset + k)[offset:]]
+
+    sentences = []
+    for shard, sentence_id, score, terms in corpus.top_sentences(query, offset + k)[offset:]:
+        sentence = shard.sentences[sentence_id]
+        sentences.append({
+            'text': sentence.text,
+            'source': shard.sources[sentence.section_id],
+            'score': round(score, 4),
+            'start': sentence.start,
+            'end': sentence.end,
+            'terms': list(terms),
+            'highlights': shard.highlights(sentence_id, terms)
+        })
+
+    return {
+        'success': True,
+        'query': query,
+        'k': k,
+        'offset': offset,
+        'sections': sections,
+        'sentences': sentences
+    }
+
+
+def warm_up(top_n: int = WARMUP_TOP_N, budget: float = WARMUP_BUDGET_SECONDS) -> WarmUpReport:
+    """
+    Answer every predefined question and the top_n most frequent logged
+    questions so this worker starts with loaded corpora and a warm question
+    cache. Stops when the time budget runs out.
+    """
+    global warm_up_report
+    start = time.perf_counter()
+    candidates = [(DEFAULT_TENANT, qa.question) for qa in PREDEFINED_QA]
+    candidates += [(tenant_id, question) for tenant_id, question in query_log.top(top_n)
+                   if corpus_registry.has_tenant(tenant_id)]
+
+    preloaded, exhausted = 0, False
+    for tenant_id, question in candidates:
+        if time.perf_counter() - start >= budget:
+            exhausted = True
+            break
+        try:
+            # Replayed questions are not traffic, so they stay out of the hit rate
+            answer_question(question, tenant_id, record_stats=False)
+        except Exception as e:
+            logging.warning(f"Warm-up skipped {question!r} for {tenant_id}: {e}")
+            continue
+        preloaded += 1
+
+    warm_up_report = WarmUpReport(
+        preloaded=preloaded,
+        candidates=len(candidates),
+        seconds=round(time.perf_counter() - start, 3),
+        budget_exhausted=exhausted,
+    )
+    logging.info(f"Warm-up preloaded {preloaded} of {len(candidates)} questions "
+                 f"in {warm_up_report.seconds:.3f} s")
+    return warm_up_report
@@ -1,4 +1,6 @@
 from models import ComplianceSection, ChatMessage
+from search_index import MIN_QA_OVERLAP
+from corpus_registry import corpus_registry, DEFAULT_TENANT, DEFAULT_DOCUMENT
 from typing import List, Dict
 import re
 
@@ -227,6 +229,9 @@ COMPLIANCE_HANDBOOK = {
     ]
 }
 
+# Source attached to the fallback answer when nothing in the handbook matches
+FALLBACK_SOURCE = "Compliance Handbook"
+
 # Predefined questions and answers for the chat demo
 PREDEFINED_QA = [
     ChatMessage(
@@ -261,45 +266,41 @@ PREDEFINED_QA = [
     )
 ]
 
-def search_handbook(query: str) -> List[ChatMessage]:
+def search_handbook(query: str, limit: int = 1, tenant_id: str = DEFAULT_TENANT) -> List[ChatMessage]:
     """
-    Search the compliance handbook for relevant information based on the query.
-    Returns a list of ChatMessage objects with answers and sources.
+    Search the tenant's compliance corpus for relevant information based on the query.
+    Misspelled query terms are resolved against each document's vocabulary first.
+    Returns up to limit ChatMessage objects with answers and sources, best first.
     """
-    query_lower = query.lower()
+    # Hold one corpus snapshot for the whole search, even if an update lands meanwhile
+    corpus = corpus_registry.get(tenant_id)
     
-    # Check predefined Q&A first
-    for qa in PREDEFINED_QA:
-        if any(keyword in query_lower for keyword in qa.question.lower().split()):
-            return [qa]
+    # Check predefined Q&A first; they describe the built-in handbook only
+    if tenant_id == DEFAULT_TENANT and DEFAULT_DOCUMENT in corpus.shards:
+        index = corpus.shards[DEFAULT_DOCUMENT]
+        terms = index.resolve_terms(query)
+        for qa in PREDEFINED_QA:
+            qa_terms = index.resolve_terms(qa.question)
+            if qa_terms and sum(term in terms for term in qa_terms) / len(qa_terms) >= MIN_QA_OVERLAP:
+                return [qa]
     
-    # Search through handbook sections
+    # Rank sections across the tenant's documents by the query terms they contain
     results = []
-    for section in COMPLIANCE_HANDBOOK["sections"]:
-        title_match = any(word in section.title.lower() for word in query_lower.split())
-        content_match = any(word in section.content.lower() for word in query_lower.split())
-        
-        if title_match or content_match:
-            # Extract relevant paragraph
-            sentences = section.content.split('.')
-            relevant_sentences = [s for s in sentences if any(word in s.lower() for word in query_lower.split())]
-            
-            if relevant_sentences:
-                answer = '. '.join(relevant_sentences[:3]) + '.'
-                sources = [f"{section.title} - Page {section.page_number}"]
-                
-                results.append(ChatMessage(
-                    question=query,
-                    answer=answer.strip(),
-                    sources=sources
-                ))
+    for shard, section_id, _, terms in corpus.top_sections(query, limit):
+        sentence_ids = shard.best_sentences(section_id, terms)
+        if sentence_ids:
+            results.append(ChatMessage(
+                question=query,
+                answer=shard.answer_text(sentence_ids),
+                sources=[shard.sources[section_id]]
+            ))
     
     # Default response if no specific match found
     if not results:
         results.append(ChatMessage(
             question=query,
             answer="I couldn't find specific information about that topic in the compliance handbook. Please try rephrasing your question or ask about SOC 2, GDPR, HIPAA, ISO 27001, encryption, access control, audit logging, disaster recovery, vendor management, or incident response.",
-            sources=["Compliance Handbook"]
+            sources=[FALLBACK_SOURCE]
         ))
     
-    return results[:1]  # Return top result
+    return results[:limit]
@@ -0,0 +1,328 @@
+"""
+Per-tenant compliance corpora.
+
+Every customer (tenant) owns a corpus of documents such as handbooks,
+policies and SOC reports. Each document is indexed into its own shard,
+a pickled HandbookIndex stored under CORPUS_DIR/<tenant>/<document>.pickle.
+Shards are built in parallel on a process pool at ingestion time, loaded
+lazily on first use and dropped again when a tenant goes cold.
+"""
+import fcntl
+import heapq
+import logging
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from models import ComplianceSection
+from search_index import HandbookIndex, get_handbook_index
+
+DEFAULT_TENANT = "default"
+DEFAULT_DOCUMENT = "handbook"
+
+_TENANT_ID_RE = re.compile(r"^[a-z0-9][a-z0-9._-]{0,63}$")
+_HEADING_RE = re.compile(r"^=+\n(\d+)\.\s+(.+?)\n=+$", re.M)
+_TOC_RE = re.compile(r"^(\d+)\.\s+(.+?)\s*\.{2,}\s*Page\s+(\d+)\s*$", re.M)
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """Return the tenant id if it is safe to use as a directory name."""
+    if not tenant_id or not _TENANT_ID_RE.match(tenant_id) or ".." in tenant_id:
+        raise ValueError(f"Invalid tenant id: {tenant_id!r}")
+    return tenant_id
+
+
+def validate_document_id(document_id: str) -> str:
+    """Return the document id if it is safe to use as a shard file name."""
+    if not document_id or not _TENANT_ID_RE.match(document_id) or ".." in document_id:
+        raise ValueError(f"Invalid document id: {document_id!r}")
+    return document_id
+
+
+def document_id_for(path: str) -> str:
+    """Derive a shard name from a document's file name."""
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    return re.sub(r"[^a-z0-9._-]+", "-", name).strip("-.") or "document"
+
+
+def parse_handbook_text(text: str, default_title: str = "Document") -> List[ComplianceSection]:
+    """
+    Split a plain-text handbook into sections.
+    Sections are introduced by a numbered heading framed with '=' rules, as in
+    compliance_handbook.txt; titles and pages come from the table of contents
+    when it lists the section. Text without headings becomes one section.
+    """
+    toc = {int(number): (title, int(page)) for number, title, page in _TOC_RE.findall(text)}
+    headings = list(_HEADING_RE.finditer(text))
+    if not headings:
+        return [ComplianceSection(title=default_title, content=text.strip(), page_number=1)]
+
+    sections = []
+    for position, heading in enumerate(headings):
+        number = int(heading.group(1))
+        end = headings[position + 1].start() if position + 1 < len(headings) else len(text)
+        title, page = toc.get(number, (heading.group(2).strip().title(), number))
+        sections.append(ComplianceSection(
+            title=title,
+            content=text[heading.end():end].strip(),
+            page_number=page,
+        ))
+    return sections
+
+
+def _build_shard(job: Tuple[str, str, str]) -> Tuple[str, int]:
+    """Index one document and write its shard; runs in a pool process."""
+    source_path, shard_path, default_title = job
+    with open(source_path, encoding="utf-8") as handle:
+        sections = parse_handbook_text(handle.read(), default_title)
+    write_shard(shard_path, HandbookIndex(sections))
+    return shard_path, len(sections)
+
+
+def write_shard(shard_path: str, index: HandbookIndex) -> None:
+    """Pickle a shard next to its final path and move it into place atomically."""
+    temporary_path = f"{shard_path}.tmp-{os.getpid()}"
+    with open(temporary_path, "wb") as handle:
+        pickle.dump(index, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, shard_path)
+
+
+class TenantCorpus:
+    """
+    An immutable view of one tenant's shards, searchable as a single corpus.
+    Updates publish a new TenantCorpus instead of modifying this one.
+    """
+
+    def __init__(self, tenant_id: str, shards: Dict[str, HandbookIndex], version=None):
+        self.tenant_id = tenant_id
+        self.shards = shards
+        self.version = version
+
+    @property
+    def cache_namespace(self) -> str:
+        """Namespace for answers derived from this exact version of the corpus."""
+        return f"{self.tenant_id}@{self.version}" if self.version is not None else self.tenant_id
+
+    def resolve_terms(self, query: str) -> FrozenSet[str]:
+        """Query terms resolved against the vocabulary of any of the tenant's shards."""
+        return frozenset(term for shard in self.shards.values() for term in shard.resolve_terms(query))
+
+    def _merge(self, query: str, k: int, method: str) -> List[Tuple[HandbookIndex, int, float, Dict[str, float]]]:
+        # Each shard resolves the query against its own vocabulary and ranks
+        # its own top k; the global top k is among those candidates.
+        candidates = []
+        for document_id, shard in sorted(self.shards.items()):
+            terms = shard.term_weights(query)
+            for item_id, score in getattr(shard, method)(terms, k):
+                candidates.append((score, document_id, item_id, shard, terms))
+        best = heapq.nlargest(k, candidates, key=lambda c: c[0])
+        return [(shard, item_id, score, terms) for score, _, item_id, shard, terms in best]
+
+    def top_sections(self, query: str, k: int) -> List[Tuple[HandbookIndex, int, float, Dict[str, float]]]:
+        """Top k (shard, section id, score, resolved term weights) across all shards."""
+        return self._merge(query, k, "top_sections")
+
+    def top_sentences(self, query: str, k: int) -> List[Tuple[HandbookIndex, int, float, Dict[str, float]]]:
+        """Top k (shard, sentence id, score, resolved term weights) across all shards."""
+        return self._merge(query, k, "top_sentences")
+
+
+class CorpusRegistry:
+    """
+    Registry of tenant corpora with lazy loading and LRU eviction.
+    The default tenant serves the built-in compliance handbook until shards
+    are written for it; other tenants are read from disk on first use.
+
+    Every write to a tenant replaces its VERSION marker file. Workers compare
+    the marker with the version they loaded on each lookup, so a change made
+    by any worker becomes visible to all of them without a restart.
+    """
+
+    def __init__(self, root: str, max_tenants: int = 32):
+        self.root = root
+        self.max_tenants = max_tenants
+        self._loaded: "OrderedDict[str, TenantCorpus]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tenant_dir(self, tenant_id: str) -> str:
+        return os.path.join(self.root, validate_tenant_id(tenant_id))
+
+    def has_tenant(self, tenant_id: str) -> bool:
+        if tenant_id == DEFAULT_TENANT:
+            return True
+        try:
+            return os.path.isdir(self.tenant_dir(tenant_id))
+        except ValueError:
+            return False
+
+    def tenant_for_email(self, email: Optional[str], verified: bool = False) -> str:
+        """
+        Tenant whose corpus a user may search: the domain of their email, if
+        the identity provider verified the address and the tenant exists.
+        """
+        if verified and email and "@" in email:
+            domain = email.rsplit("@", 1)[1].lower()
+            if self.has_tenant(domain):
+                return domain
+        return DEFAULT_TENANT
+
+    def get(self, tenant_id: str) -> TenantCorpus:
+        """Return the current snapshot of the tenant's corpus, loading it if needed."""
+        version = self._read_version(tenant_id)
+        with self._lock:
+            corpus = self._loaded.get(tenant_id)
+            if corpus is not None and corpus.version == version:
+                self._loaded.move_to_end(tenant_id)
+                return corpus
+
+        if tenant_id == DEFAULT_TENANT and version is None:
+            shards = {DEFAULT_DOCUMENT: get_handbook_index()}
+        else:
+            shards = self._load_shards(tenant_id)
+        return self._publish(TenantCorpus(tenant_id, shards, version))
+
+    def _publish(self, corpus: TenantCorpus) -> TenantCorpus:
+        # Swapping the reference is atomic; requests already holding the old
+        # corpus finish on it and it is reclaimed once the last one lets go
+        with self._lock:
+            self._loaded[corpus.tenant_id] = corpus
+            self._loaded.move_to_end(corpus.tenant_id)
+            while len(self._loaded) > self.max_tenants:
+                evicted, _ = self._loaded.popitem(last=False)
+                logging.info(f"Evicted cold tenant corpus: {evicted}")
+        return corpus
+
+    def _version_path(self, tenant_id: str) -> str:
+        return os.path.join(self.tenant_dir(tenant_id), "VERSION")
+
+    def _read_version(self, tenant_id: str) -> Optional[Tuple[int, int]]:
+        try:
+            marker = os.stat(self._version_path(tenant_id))
+        except FileNotFoundError:
+            return None
+        # The marker is replaced on every write, so its inode changes even
+        # when two writes land within the file system's timestamp resolution
+        return marker.st_ino, marker.st_mtime_ns
+
+    def _bump_version(self, tenant_id: str) -> None:
+        path = self._version_path(tenant_id)
+        temporary_path = f"{path}.tmp-{os.getpid()}"
+        with open(temporary_path, "w") as handle:
+            handle.write(str(time.time_ns()))
+        os.replace(temporary_path, path)
+
+    def _load_shards(self, tenant_id: str) -> Dict[str, HandbookIndex]:
+        shards = {}
+        directory = self.tenant_dir(tenant_id)
+        if not os.path.isdir(directory):
+            return shards
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".pickle"):
+                with open(os.path.join(directory, name), "rb") as handle:
+                    shards[name[:-len(".pickle")]] = pickle.load(handle)
+        return shards
+
+    @contextmanager
+    def _write_lock(self, tenant_id: str):
+        """Serialize writers to one tenant across worker processes."""
+        directory = self.tenant_dir(tenant_id)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield directory
+
+    def _persist_unwritten(self, corpus: TenantCorpus, directory: str, skip: Iterable[str]) -> None:
+        # Before a tenant's first write its corpus may exist only in memory,
+        # as the built-in handbook does; once VERSION exists only disk is read
+        if corpus.version is None:
+            for document_id, shard in corpus.shards.items():
+                if document_id not in skip:
+                    write_shard(os.path.join(directory, f"{document_id}.pickle"), shard)
+
+    def evict(self, tenant_id: str) -> None:
+        """Drop a tenant's loaded shards so the next search reloads them."""
+        with self._lock:
+            self._loaded.pop(tenant_id, None)
+
+    def update_document(self, tenant_id: str, document_id: str,
+                        upserts: Iterable[ComplianceSection] = (),
+                        deletes: Iterable[str] = ()) -> HandbookIndex:
+        """
+        Add, replace or delete sections of one document without rebuilding it.
+        The new shard is written to disk and published as a new snapshot of
+        the tenant's corpus. Raises KeyError if a title to delete is unknown.
+        """
+        validate_document_id(document_id)
+
+        # Serialize writers across worker processes so no update is lost
+        with self._write_lock(tenant_id) as directory:
+            corpus = self.get(tenant_id)
+            base = corpus.shards.get(document_id) or HandbookIndex()
+            shard = base.apply(upserts, deletes)
+
+            shards = dict(corpus.shards)
+            shards[document_id] = shard
+            self._persist_unwritten(corpus, directory, skip={document_id})
+            write_shard(os.path.join(directory, f"{document_id}.pickle"), shard)
+            self._bump_version(tenant_id)
+            self._publish(TenantCorpus(tenant_id, shards, self._read_version(tenant_id)))
+
+        logging.info(f"Updated {tenant_id}/{document_id} to snapshot version {shard.version}")
+        return shard
+
+    def ingest(self, tenant_id: str, paths: Iterable[str],
+               max_workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        Index the given text documents into the tenant's corpus in parallel.
+        Returns the number of sections indexed per document id.
+        """
+        directory = self.tenant_dir(tenant_id)
+        os.makedirs(directory, exist_ok=True)
+        jobs = []
+        for path in paths:
+            document_id = document_id_for(path)
+            title = os.path.splitext(os.path.basename(path))[0].replace("_", " ").title()
+            jobs.append((path, os.path.join(directory, f"{document_id}.pickle"), title))
+        if not jobs:
+            return {}
+
+        # Forked workers inherit the already-imported app modules instead of
+        # re-importing them, which would reinitialize the Flask app
+        context = (multiprocessing.get_context("fork")
+                   if "fork" in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            built = list(executor.map(_build_shard, jobs))
+
+        with self._write_lock(tenant_id):
+            self._persist_unwritten(self.get(tenant_id), directory,
+                                    skip={document_id_for(path) for path, _, _ in jobs})
+            self._bump_version(tenant_id)
+        counts = {document_id_for(path): count for (path, _, _), (_, count) in zip(jobs, built)}
+        logging.info(f"Ingested {len(counts)} documents for tenant {tenant_id}")
+        return counts
+
+
+corpus_registry = CorpusRegistry(
+    root=os.environ.get("CORPUS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")),
+    max_tenants=int(os.environ.get("CORPUS_MAX_TENANTS", "32")),
+)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest documents into a tenant corpus")
+    parser.add_argument("tenant", help="tenant id, e.g. the customer's email domain")
+    parser.add_argument("documents", nargs="+", help="plain-text documents to index")
+    parser.add_argument("--workers", type=int, default=None, help="ingestion processes")
+    args = parser.parse_args()
+
+    for document_id, count in corpus_registry.ingest(args.tenant, args.documents, args.workers).items():
+        print(f"{document_id}: {count} sections")
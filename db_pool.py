@@ -0,0 +1,185 @@
+"""
+Database connection pool configuration and instrumentation.
+
+Pool sizing comes from the environment. Instead of pinging the server on
+every checkout, a connection is pinged only when it has sat idle long
+enough for the server or a proxy to have dropped it; errors on a live
+connection still invalidate it through SQLAlchemy's disconnect handling.
+Connections are recycled at a jittered age so a worker's pool does not
+reconnect all at once, opened at worker boot rather than on the first
+request, and the pool reports checkout waits, usage, overflow and recycles.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DisconnectionError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = float(os.environ.get("DB_POOL_RECYCLE", "1800"))
+POOL_PING_AFTER_IDLE = float(os.environ.get("DB_POOL_PING_AFTER_IDLE", "60"))
+POOL_PREWARM = int(os.environ.get("DB_POOL_PREWARM", str(POOL_SIZE)))
+
+# Recycle each connection somewhere in the last fifth of its lifetime
+_RECYCLE_JITTER = 0.2
+
+
+class _Recycle(DisconnectionError):
+    """Raised on checkout to replace a connection that reached its age limit."""
+
+
+class PoolMetrics:
+    """Counters for the connection pool, shared by all threads of a worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.connects = 0
+        self.recycles = 0
+        self.invalidations = 0
+        self.pings = 0
+        self.ping_failures = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self, pool: QueuePool) -> dict:
+        with self._lock:
+            return {
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": POOL_MAX_OVERFLOW,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.timeouts,
+                "checkout_wait_ms_avg": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "checkout_wait_ms_max": round(1000 * self.wait_max, 3),
+                "connects": self.connects,
+                "recycles": self.recycles,
+                "invalidations": self.invalidations,
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+@event.listens_for(InstrumentedQueuePool, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_metrics.increment("connects")
+    if POOL_RECYCLE > 0:
+        lifetime = POOL_RECYCLE * random.uniform(1 - _RECYCLE_JITTER, 1.0)
+        connection_record.info["recycle_at"] = time.monotonic() + lifetime
+
+
+@event.listens_for(InstrumentedQueuePool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    connection_record.info["checked_in_at"] = time.monotonic()
+
+
+@event.listens_for(InstrumentedQueuePool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    now = time.monotonic()
+    if now >= connection_record.info.get("recycle_at", float("inf")):
+        pool_metrics.increment("recycles")
+        raise _Recycle("connection reached its recycle age")
+
+    # A connection handed back recently is almost certainly still alive
+    checked_in_at = connection_record.info.pop("checked_in_at", None)
+    if checked_in_at is None or now - checked_in_at < POOL_PING_AFTER_IDLE:
+        return
+
+    pool_metrics.increment("pings")
+    try:
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        finally:
+            cursor.close()
+    except Exception as e:
+        pool_metrics.increment("ping_failures")
+        raise DisconnectionError(f"idle connection failed liveness check: {e}")
+
+
+@event.listens_for(InstrumentedQueuePool, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    if not isinstance(exception, _Recycle):
+        pool_metrics.increment("invalidations")
+
+
+def engine_options() -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for the instrumented, env-sized pool."""
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        # Recycling and liveness are handled by the checkout hook above
+        "pool_pre_ping": False,
+        "pool_recycle": -1,
+        # Reuse the most recently returned connection so surplus ones go
+        # idle long enough to be closed by the server's idle timeout
+        "pool_use_lifo": True,
+    }
+
+
+def prewarm_pool(engine: Engine, count: int = POOL_PREWARM) -> int:
+    """Open up to count pooled connections now instead of on first use."""
+    count = min(count, POOL_SIZE)
+    start = time.perf_counter()
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.raw_connection())
+    except Exception as e:
+        logging.warning(f"Connection pool pre-warm stopped early: {e}")
+    finally:
+        for connection in connections:
+            connection.close()
+    logging.info(f"Pre-warmed {len(connections)} database connections in "
+                 f"{1000 * (time.perf_counter() - start):.1f} ms")
+    return len(connections)
+
+
+def detach_pool_after_fork(engine: Engine) -> None:
+    """
+    Give forked child processes a fresh pool. Children such as the ingestion
+    and retrieval pools must never reuse the parent's open connections.
+    """
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
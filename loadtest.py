@@ -0,0 +1,517 @@
+"""
+Load-test harness for the VaultLogic app.
+
+Starts the app under gunicorn with the requested worker class and count,
+plus a stub OpenID Connect issuer so virtual users can log in through the
+real Replit Auth flow. Virtual users replay a realistic traffic mix of page
+views, demo chat questions and searches, and the run reports throughput,
+latency percentiles, error rates and the resident memory of every worker.
+
+    python loadtest.py --workers 4 --worker-class gthread --threads 8 \\
+        --users 50 --duration 60
+
+Use --target to drive an already running server instead; authenticated
+traffic then requires that server to trust the issuer given by --issuer-port.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import jwt
+import requests
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+QUESTIONS = [
+    "Do you encrypt data at rest?",
+    "Is customer data encrypted at rest?",
+    "What encryption do you use for data in transit?",
+    "Are you SOC 2 Type II certified?",
+    "Can you share your SOC 2 report?",
+    "Are you HIPAA compliant?",
+    "Do you sign a BAA?",
+    "Is VaultLogic GDPR compliant?",
+    "How do you handle data subject access requests?",
+    "Are you ISO 27001 certified?",
+    "Do you support SSO and MFA?",
+    "How often are access reviews performed?",
+    "What is your RTO and RPO?",
+    "Do you have a disaster recovery plan?",
+    "How long do you retain audit logs?",
+    "Do you perform penetration testing?",
+    "How do you assess vendor risk?",
+    "Describe your incident response process.",
+    "Do you have a 24/7 security operations center?",
+    "How are encryption keys managed and rotated?",
+    # Misspellings and glued terms the typo-tolerant search must absorb
+    "Are you HIPPA compliant?",
+    "What encyrption standards do you follow?",
+    "Are you ISO27001 certified?",
+]
+
+# (weight, scenario name, needs login)
+TRAFFIC_MIX = [
+    (15, "home", False),
+    (10, "demo", False),
+    (45, "chat", False),
+    (10, "search", False),
+    (10, "home_authenticated", True),
+    (10, "chat_authenticated", True),
+]
+
+_CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def _b64url_uint(value: int) -> str:
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class StubIssuer:
+    """
+    Minimal OpenID Connect issuer standing in for Replit's.
+    It approves every authorization request and signs ID tokens for a
+    fresh synthetic user each time, using a key published at the JWKS URL.
+    """
+
+    def __init__(self, client_id: str, port: int = 0):
+        self.client_id = client_id
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.logins = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler(self):
+        issuer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path == "/.well-known/jwks.json":
+                    numbers = issuer.key.public_key().public_numbers()
+                    self._json({"keys": [{
+                        "kty": "RSA", "alg": "RS256", "use": "sig", "kid": "loadtest",
+                        "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e),
+                    }]})
+                elif url.path == "/auth":
+                    location = query["redirect_uri"] + "?" + urlencode({
+                        "code": uuid.uuid4().hex, "state": query.get("state", ""),
+                    })
+                    self.send_response(302)
+                    self.send_header("Location", location)
+                    self.end_headers()
+                elif url.path == "/session/end":
+                    self.send_response(302)
+                    self.send_header("Location", query.get("post_logout_redirect_uri", "/"))
+                    self.end_headers()
+                else:
+                    self._json({"error": "not_found"}, 404)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlparse(self.path).path != "/token":
+                    self._json({"error": "not_found"}, 404)
+                    return
+                self._json(issuer.issue_token())
+
+        return Handler
+
+    def issue_token(self) -> dict:
+        with self._lock:
+            self.logins += 1
+            number = self.logins
+        now = int(time.time())
+        claims = {
+            "iss": self.url,
+            "aud": self.client_id,
+            "sub": f"loadtest-{number}",
+            "email": f"user{number}@loadtest.example",
+            "first_name": "Load",
+            "last_name": f"Tester {number}",
+            "iat": now,
+            "exp": now + 3600,
+        }
+        return {
+            "access_token": uuid.uuid4().hex,
+            "refresh_token": uuid.uuid4().hex,
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "id_token": jwt.encode(claims, self.key, algorithm="RS256", headers={"kid": "loadtest"}),
+        }
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args, issuer: StubIssuer, workdir: str) -> subprocess.Popen:
+    """Launch the app under gunicorn and wait until it accepts requests."""
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "SESSION_SECRET": env.get("SESSION_SECRET", uuid.uuid4().hex),
+        "REPL_ID": issuer.client_id,
+        "ISSUER_URL": issuer.url,
+        # The stub issuer and local app speak plain HTTP
+        "OAUTHLIB_INSECURE_TRANSPORT": "1",
+        # Every virtual user comes from 127.0.0.1 and would share one IP bucket
+        "CHAT_RATE_LIMIT_ENABLED": "1" if args.rate_limit else "0",
+        "CHAT_RATE_LIMIT_DB": os.path.join(workdir, "rate-limit.sqlite3"),
+        # Keep synthetic questions out of the real warm-up log
+        "QUERY_LOG_DB": os.path.join(workdir, "query-log.sqlite3"),
+    })
+    root = os.path.dirname(os.path.abspath(__file__))
+    # Create the schema once; workers booting together would race on create_all
+    subprocess.run([sys.executable, "-c", "import app"], cwd=root, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"127.0.0.1:{args.port}",
+        "--reuse-port",
+        "--workers", str(args.workers),
+        "--worker-class", args.worker_class,
+        "--threads", str(args.threads),
+        "--log-level", "warning",
+        "main:app",
+    ]
+    process = subprocess.Popen(
+        command, cwd=root, env=env,
+        stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, "gunicorn.log"), "w"),
+    )
+
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early; see {workdir}/gunicorn.log")
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def worker_pids(master_pid: int) -> List[int]:
+    """Child processes of the gunicorn master, read from /proc."""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as handle:
+                # The command name may contain spaces; fields resume after ')'
+                fields = handle.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def rss_kib(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Periodically record the peak and last RSS of every gunicorn worker."""
+
+    def __init__(self, master_pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak: Dict[int, int] = {}
+        self.last: Dict[int, int] = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.interval)
+
+    def sample(self):
+        for pid in worker_pids(self.master_pid):
+            rss = rss_kib(pid)
+            if rss is not None:
+                self.last[pid] = rss
+                self.peak[pid] = max(rss, self.peak.get(pid, 0))
+
+    def stop(self):
+        self._stop_event.set()
+        self.sample()
+
+
+class Stats:
+    """Thread-safe latency and error bookkeeping per endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, status: int, ok: bool) -> None:
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.statuses[status] += 1
+            if not ok:
+                self.errors[name] += 1
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class VirtualUser(threading.Thread):
+    """One simulated browser session replaying the traffic mix."""
+
+    def __init__(self, base_url: str, stats: Stats, deadline: float, think_time: float,
+                 seed: int, authenticated: bool):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.stats = stats
+        self.deadline = deadline
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.authenticated = authenticated
+        self.logged_in = False
+        self.session = requests.Session()
+        self.csrf_token = None
+        weights = [(w, name) for w, name, needs_login in TRAFFIC_MIX if authenticated or not needs_login]
+        self.scenarios = [name for _, name in weights]
+        self.weights = [w for w, _ in weights]
+
+    def request(self, name: str, method: str, path: str, ok_check=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.stats.record(name, time.perf_counter() - started, 0, False)
+            return None
+        ok = response.status_code < 400 and (ok_check is None or ok_check(response))
+        self.stats.record(name, time.perf_counter() - started, response.status_code, ok)
+        return response
+
+    def load_demo(self, name: str = "GET /demo"):
+        response = self.request(name, "GET", "/demo")
+        if response is not None:
+            match = _CSRF_RE.search(response.text)
+            self.csrf_token = match.group(1) if match else None
+
+    def ask(self, name: str):
+        if not self.csrf_token:
+            self.load_demo()
+        question = self.random.choice(QUESTIONS)
+        self.request(
+            name, "POST", "/chat",
+            ok_check=lambda response: response.json().get("success", False),
+            data={"question": question, "csrf_token": self.csrf_token or ""},
+            headers={"X-CSRFToken": self.csrf_token or ""},
+        )
+
+    def login(self):
+        # Follows the redirects through the stub issuer back to the app
+        self.logged_in = self.request(
+            "login", "GET", "/auth/replit_auth",
+            ok_check=lambda response: "replit_auth/error" not in response.url,
+        ) is not None
+
+    def run(self):
+        while time.time() < self.deadline:
+            scenario = self.random.choices(self.scenarios, self.weights)[0]
+            if scenario.endswith("_authenticated") and not self.logged_in:
+                self.login()
+            if scenario in ("home", "home_authenticated"):
+                self.request(f"GET / ({'auth' if scenario != 'home' else 'anon'})", "GET", "/")
+            elif scenario == "demo":
+                self.load_demo()
+            elif scenario in ("chat", "chat_authenticated"):
+                self.ask(f"POST /chat ({'auth' if scenario != 'chat' else 'anon'})")
+            elif scenario == "search":
+                self.request("GET /api/search", "GET", "/api/search",
+                             params={"q": self.random.choice(QUESTIONS), "k": 5})
+            if self.think_time:
+                time.sleep(self.random.expovariate(1 / self.think_time))
+
+
+def report(stats: Stats, elapsed: float, sampler: Optional[RssSampler], args) -> dict:
+    endpoints = {}
+    total_requests = sum(len(values) for values in stats.latencies.values())
+    total_errors = sum(stats.errors.values())
+    for name in sorted(stats.latencies):
+        values = stats.latencies[name]
+        endpoints[name] = {
+            "requests": len(values),
+            "rps": round(len(values) / elapsed, 2),
+            "errors": stats.errors.get(name, 0),
+            "error_rate": round(stats.errors.get(name, 0) / len(values), 4),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p90_ms": round(percentile(values, 0.90) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            "p999_ms": round(percentile(values, 0.999) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+        }
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    workers = {}
+    if sampler is not None:
+        workers = {
+            str(pid): {"peak_rss_mib": round(sampler.peak[pid] / 1024, 1),
+                       "last_rss_mib": round(sampler.last[pid] / 1024, 1)}
+            for pid in sorted(sampler.peak)
+        }
+    return {
+        "config": {
+            "workers": args.workers, "worker_class": args.worker_class, "threads": args.threads,
+            "users": args.users, "authenticated_share": args.authenticated_share,
+            "duration_s": round(elapsed, 1), "think_time_s": args.think_time,
+        },
+        "total": {
+            "requests": total_requests,
+            "rps": round(total_requests / elapsed, 2),
+            "errors": total_errors,
+            "error_rate": round(total_errors / total_requests, 4) if total_requests else 0.0,
+            "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 1),
+            "p999_ms": round(percentile(all_latencies, 0.999) * 1000, 1),
+        },
+        "status_codes": {str(code): count for code, count in sorted(stats.statuses.items())},
+        "endpoints": endpoints,
+        "workers": workers,
+    }
+
+
+def print_report(result: dict) -> None:
+    config, total = result["config"], result["total"]
+    print(f"\n{config['workers']} x {config['worker_class']} workers "
+          f"({config['threads']} threads), {config['users']} users, {config['duration_s']}s")
+    print(f"Total: {total['requests']} requests, {total['rps']} req/s, "
+          f"error rate {total['error_rate']:.2%}, p50 {total['p50_ms']} ms, "
+          f"p99 {total['p99_ms']} ms, p99.9 {total['p999_ms']} ms")
+    print(f"\n{'endpoint':<24}{'reqs':>8}{'req/s':>9}{'err%':>8}"
+          f"{'p50':>9}{'p90':>9}{'p99':>9}{'p99.9':>9}{'max':>9}")
+    for name, row in result["endpoints"].items():
+        print(f"{name:<24}{row['requests']:>8}{row['rps']:>9}{row['error_rate']:>8.2%}"
+              f"{row['p50_ms']:>9}{row['p90_ms']:>9}{row['p99_ms']:>9}{row['p999_ms']:>9}{row['max_ms']:>9}")
+    print(f"\nStatus codes: {result['status_codes']}")
+    if result["workers"]:
+        print("\nWorker RSS (MiB):")
+        for pid, row in result["workers"].items():
+            print(f"  pid {pid}: peak {row['peak_rss_mib']}, last {row['last_rss_mib']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay realistic traffic against the app")
+    parser.add_argument("--target", help="base URL of a running server; default starts gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker count")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class")
+    parser.add_argument("--threads", type=int, default=1, help="threads per gthread worker")
+    parser.add_argument("--port", type=int, default=0, help="port for the started server")
+    parser.add_argument("--database-url", help="database for the started server; default temp SQLite")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep chat admission control on in the started server")
+    parser.add_argument("--issuer-port", type=int, default=0, help="port for the stub OIDC issuer")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--authenticated-share", type=float, default=0.3,
+                        help="share of virtual users that log in")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between requests")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    issuer = StubIssuer(client_id=os.environ.get("REPL_ID", "loadtest"), port=args.issuer_port)
+    issuer.start()
+    process = None
+    sampler = None
+    workdir = tempfile.mkdtemp(prefix="vaultlogic-loadtest-")
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            args.port = args.port or _free_port()
+            process = start_gunicorn(args, issuer, workdir)
+            base_url = f"http://127.0.0.1:{args.port}"
+            if os.path.isdir("/proc"):
+                sampler = RssSampler(process.pid)
+                sampler.start()
+
+        stats = Stats()
+        started = time.time()
+        deadline = started + args.duration
+        authenticated_users = round(args.users * args.authenticated_share)
+        users = [
+            VirtualUser(base_url, stats, deadline, args.think_time, args.seed + number,
+                        authenticated=number < authenticated_users)
+            for number in range(args.users)
+        ]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.time() - started
+
+        if sampler is not None:
+            sampler.stop()
+        result = report(stats, elapsed, sampler, args)
+        print_report(result)
+        if args.json_path:
+            with open(args.json_path, "w") as handle:
+                json.dump(result, handle, indent=2)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        issuer.stop()
+
+
+if __name__ == "__main__":
+    main()
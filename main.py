@@ -1,5 +1,9 @@
 from app import app
 import routes  # noqa: F401
+from chat_service import warm_up
+
+# Replay frequent and predefined questions before this worker takes traffic
+warm_up()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,133 @@
+"""
+Frequency log of normalized chat questions.
+
+Each worker counts questions in memory and periodically merges the counts
+into a small SQLite file shared by all workers on the host, one row per
+distinct (tenant, normalized question). Counts decay with a configurable
+half-life so questions that are newly popular can displace old ones when
+the log is full. At boot, workers read the most frequent questions back to
+warm their caches before taking traffic.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+from typing import List, Tuple
+
+from question_cache import QuestionCache
+from corpus_registry import DEFAULT_TENANT
+
+
+class QueryLog:
+    """Question frequencies buffered per worker and merged into SQLite."""
+
+    def __init__(self, path: str, flush_interval: float = 30.0, max_entries: int = 10000,
+                 half_life: float = 7 * 24 * 3600.0, enabled: bool = True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.half_life = half_life
+        self.enabled = enabled
+        self._pending: Counter = Counter()
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "tenant TEXT NOT NULL, question TEXT NOT NULL, count REAL NOT NULL, "
+            "updated REAL NOT NULL, PRIMARY KEY (tenant, question)) WITHOUT ROWID"
+        )
+        now = time.time()
+        connection.create_function(
+            "decayed", 2, lambda count, updated: count * 0.5 ** (max(now - updated, 0.0) / self.half_life),
+            deterministic=True,
+        )
+        return connection
+
+    def record(self, question: str, tenant_id: str = DEFAULT_TENANT) -> None:
+        """
+        Count one occurrence of a question. When the buffer is due, it is
+        flushed on a background thread so the caller never waits on SQLite.
+        """
+        if not self.enabled:
+            return
+        normalized = QuestionCache.normalize(question)
+        if not normalized:
+            return
+        with self._lock:
+            self._pending[(tenant_id, normalized)] += 1
+            due = not self._flushing and time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._flushing = True
+        if due:
+            threading.Thread(target=self._flush_in_background, name="query-log-flush", daemon=True).start()
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def flush(self) -> None:
+        """
+        Merge buffered counts into the shared log and trim it to max_entries.
+        Questions counted in this batch are kept even below the cutoff, so a
+        new question survives until a later flush finds it still unpopular.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        now = time.time()
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    "INSERT INTO questions (tenant, question, count, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(tenant, question) DO UPDATE SET "
+                    "count = decayed(count, updated) + excluded.count, updated = excluded.updated",
+                    [(tenant, question, count, now) for (tenant, question), count in pending.items()],
+                )
+                connection.execute(
+                    "DELETE FROM questions WHERE updated < ? AND (tenant, question) NOT IN ("
+                    "SELECT tenant, question FROM questions ORDER BY decayed(count, updated) DESC LIMIT ?)",
+                    (now, self.max_entries),
+                )
+        except sqlite3.Error as e:
+            # Losing a batch of counts only makes the next warm-up less precise
+            logging.warning(f"Query log unavailable, dropped {len(pending)} entries: {e}")
+
+    def top(self, limit: int) -> List[Tuple[str, str]]:
+        """The most frequent (tenant, normalized question) pairs."""
+        if not self.enabled or limit <= 0 or not os.path.exists(self.path):
+            return []
+        try:
+            with closing(self._connect()) as connection:
+                return connection.execute(
+                    "SELECT tenant, question FROM questions ORDER BY decayed(count, updated) DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Query log unavailable: {e}")
+            return []
+
+
+query_log = QueryLog(
+    path=os.environ.get(
+        "QUERY_LOG_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_log.sqlite3")
+    ),
+    flush_interval=float(os.environ.get("QUERY_LOG_FLUSH_INTERVAL", "30")),
+    max_entries=int(os.environ.get("QUERY_LOG_SIZE", "10000")),
+    half_life=float(os.environ.get("QUERY_LOG_HALF_LIFE", str(7 * 24 * 3600))),
+    enabled=os.environ.get("QUERY_LOG_ENABLED", "1") != "0",
+)
+atexit.register(query_log.flush)
@@ -0,0 +1,191 @@
+"""
+Near-duplicate question cache for the chat endpoint.
+
+Questionnaire questions arrive phrased in many near-identical ways, so the
+cache keys answers by a MinHash signature of the question's character
+trigrams instead of its exact text. Locality-sensitive hashing over bands
+of the signature finds previously answered questions whose estimated
+Jaccard similarity clears a configurable threshold.
+
+Trigram similarity barely moves when a question changes a number or adds
+a negation ("SOC 1" vs "SOC 2", "encrypted" vs "not encrypted"), so a
+candidate is only reused when its distinguishing terms match exactly.
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import AbstractSet, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from models import ChatMessage
+from search_index import query_terms, tokenize, trigrams
+from corpus_registry import DEFAULT_TENANT
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+# A fixed seed keeps signatures identical across worker processes
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+# Negations, including the "t" left by n't contractions, and roman numerals
+# as in "Type I" vs "Type II"; several of these are search stopwords
+_NEGATIONS = frozenset({"no", "not", "never", "none", "nor", "without", "cannot", "t"})
+_NUMERALS = frozenset({"i", "ii", "iii", "iv"})
+_DIGITS_RE = re.compile(r"[0-9]+")
+
+
+def distinguishing_terms(question: str, key_terms: AbstractSet[str] = frozenset()) -> FrozenSet[str]:
+    """
+    Terms two questions must share exactly to share an answer: digit runs,
+    negations, roman numerals and the given key terms, typically the
+    question's terms resolved against the corpus vocabulary.
+    """
+    tokens = set(tokenize(question))
+    return frozenset(_DIGITS_RE.findall(question)) | (tokens & (_NEGATIONS | _NUMERALS)) | frozenset(key_terms)
+
+
+def question_shingles(question: str) -> Set[str]:
+    """Character trigrams of the question's non-stopword terms."""
+    return {gram for term in query_terms(question) for gram in trigrams(term)}
+
+
+def _shingle_hash(shingle: str) -> int:
+    # Python's built-in hash() is salted per process, so use a stable digest
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash_signature(shingles: Set[str]) -> Tuple[int, ...]:
+    """MinHash signature of a shingle set under the fixed permutations."""
+    hashes = [_shingle_hash(shingle) for shingle in shingles]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimate_similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the sets behind two signatures."""
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERMUTATIONS
+
+
+class QuestionCache:
+    """
+    Bounded LRU cache of chat answers keyed by MinHash signature.
+    Lookups first try the normalized question text, then probe the LSH
+    band buckets and verify candidates against the similarity threshold.
+    Entries and buckets are namespaced by tenant corpus version so answers
+    never cross tenants and are not reused after the corpus changes.
+    A candidate must also have the same distinguishing terms as the question.
+    """
+
+    def __init__(self, threshold: float = 0.7, max_entries: int = 5000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Tuple[int, ...], FrozenSet[str], ChatMessage]]" = OrderedDict()
+        self._buckets: List[Dict[Tuple, Set[Tuple[str, str]]]] = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(query_terms(question))
+
+    @staticmethod
+    def _bands(namespace: str, signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield band, (namespace,) + signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+
+    def lookup(self, question: str, namespace: str = DEFAULT_TENANT,
+               key_terms: AbstractSet[str] = frozenset(), record_stats: bool = True) -> Optional[ChatMessage]:
+        """
+        Return the stored answer of a near-duplicate question, if any.
+        Lookups that are not user traffic, such as warm-up, pass
+        record_stats=False to leave the hit rate untouched.
+        """
+        key = (namespace, self.normalize(question))
+        shingles = question_shingles(question)
+        terms = distinguishing_terms(question, key_terms)
+        with self._lock:
+            if record_stats:
+                self.lookups += 1
+            if not shingles:
+                return None
+            if key in self._entries and self._entries[key][1] == terms:
+                self._entries.move_to_end(key)
+                if record_stats:
+                    self.hits += 1
+                return self._entries[key][2]
+
+            signature = minhash_signature(shingles)
+            candidates = set()
+            for band, rows in self._bands(namespace, signature):
+                candidates.update(self._buckets[band].get(rows, ()))
+
+            best_key, best_similarity = None, self.threshold
+            for candidate in candidates:
+                if self._entries[candidate][1] != terms:
+                    continue
+                similarity = estimate_similarity(signature, self._entries[candidate][0])
+                if similarity >= best_similarity:
+                    best_key, best_similarity = candidate, similarity
+            if best_key is None:
+                return None
+
+            self._entries.move_to_end(best_key)
+            if record_stats:
+                self.hits += 1
+            return self._entries[best_key][2]
+
+    def add(self, question: str, answer: ChatMessage, namespace: str = DEFAULT_TENANT,
+            key_terms: AbstractSet[str] = frozenset()) -> None:
+        """Store the answer for a question, evicting the least recently used."""
+        key = (namespace, self.normalize(question))
+        shingles = question_shingles(question)
+        if not shingles:
+            return
+        signature = minhash_signature(shingles)
+        terms = distinguishing_terms(question, key_terms)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, terms, answer)
+            for band, rows in self._bands(namespace, signature):
+                self._buckets[band].setdefault(rows, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        signature, _, _ = self._entries.pop(key)
+        for band, rows in self._bands(key[0], signature):
+            bucket = self._buckets[band].get(rows)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+
+question_cache = QuestionCache(
+    threshold=float(os.environ.get("QUESTION_CACHE_THRESHOLD", "0.7")),
+    max_entries=int(os.environ.get("QUESTION_CACHE_SIZE", "5000")),
+)
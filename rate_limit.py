@@ -0,0 +1,154 @@
+"""
+Cross-worker token-bucket admission control.
+
+Bucket state lives in a small SQLite file shared by every gunicorn worker on
+the host, so a client gets the same budget no matter which worker serves it.
+Each admission debits a per-client bucket and a shared pool bucket in one
+transaction. Anonymous and authenticated callers draw from separate pools,
+which gives signed-in users a priority lane that an anonymous flood cannot
+drain.
+"""
+import logging
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# Rows untouched for this long are refilled anyway and can be dropped
+_STALE_AFTER = 3600
+_CLEANUP_PROBABILITY = 0.01
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    rate: float   # tokens added per second
+    burst: float  # bucket capacity
+
+
+@dataclass(frozen=True)
+class Admission:
+    allowed: bool
+    retry_after: int = 0
+    # The request costs more than a full bucket holds and can never be admitted
+    oversized: bool = False
+
+
+class TokenBucketStore:
+    """Token buckets kept in a SQLite file shared across processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Losing a few counter updates on power loss is acceptable
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def acquire(self, buckets: List[Tuple[str, BucketSpec]], cost: float = 1.0) -> Admission:
+        """
+        Debit cost from every bucket, or from none of them if any is short.
+        Returns how many seconds to wait when the request is refused, or
+        marks it oversized when no amount of waiting would admit it.
+        """
+        if any(cost > spec.burst for _, spec in buckets):
+            return Admission(False, oversized=True)
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, spec in buckets:
+                row = connection.execute(
+                    "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = spec.burst if row is None else min(
+                    spec.burst, row[0] + max(0.0, now - row[1]) * spec.rate
+                )
+                levels.append((key, spec, tokens))
+
+            shortfalls = [
+                (cost - tokens) / spec.rate for _, spec, tokens in levels if tokens < cost
+            ]
+            if shortfalls:
+                connection.execute("ROLLBACK")
+                return Admission(False, max(1, math.ceil(max(shortfalls))))
+
+            connection.executemany(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(key, tokens - cost, now) for key, _, tokens in levels],
+            )
+            if random.random() < _CLEANUP_PROBABILITY:
+                connection.execute("DELETE FROM buckets WHERE updated < ?", (now - _STALE_AFTER,))
+            connection.execute("COMMIT")
+            return Admission(True)
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+
+class ChatAdmissionController:
+    """
+    Admission policy for chat requests.
+    Anonymous clients are limited per IP and share the anonymous pool;
+    authenticated users get a larger per-user budget and their own pool.
+    """
+
+    def __init__(self, store: TokenBucketStore, ip: BucketSpec, user: BucketSpec,
+                 anonymous_pool: BucketSpec, authenticated_pool: BucketSpec, enabled: bool = True):
+        self.store = store
+        self.ip = ip
+        self.user = user
+        self.anonymous_pool = anonymous_pool
+        self.authenticated_pool = authenticated_pool
+        self.enabled = enabled
+
+    def admit(self, client_ip: str, user_id: str = None, cost: float = 1.0) -> Admission:
+        """Admit a request worth cost questions, e.g. the size of a batch."""
+        if not self.enabled:
+            return Admission(True)
+        if user_id:
+            buckets = [(f"user:{user_id}", self.user), ("pool:authenticated", self.authenticated_pool)]
+        else:
+            buckets = [(f"ip:{client_ip}", self.ip), ("pool:anonymous", self.anonymous_pool)]
+        try:
+            return self.store.acquire(buckets, cost)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter must not take chat down with it
+            logging.warning(f"Rate limiter unavailable, admitting request: {e}")
+            return Admission(True)
+
+
+def _spec(prefix: str, rate: str, burst: str) -> BucketSpec:
+    return BucketSpec(
+        rate=float(os.environ.get(f"{prefix}_RATE", rate)),
+        burst=float(os.environ.get(f"{prefix}_BURST", burst)),
+    )
+
+
+chat_admission = ChatAdmissionController(
+    store=TokenBucketStore(os.environ.get(
+        "CHAT_RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "vaultlogic-rate-limit.sqlite3")
+    )),
+    ip=_spec("CHAT_IP", "1", "10"),
+    user=_spec("CHAT_USER", "3", "30"),
+    anonymous_pool=_spec("CHAT_ANONYMOUS_POOL", "20", "40"),
+    authenticated_pool=_spec("CHAT_AUTHENTICATED_POOL", "20", "40"),
+    enabled=os.environ.get("CHAT_RATE_LIMIT_ENABLED", "1") != "0",
+)
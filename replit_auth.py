@@ -226,6 +226,9 @@ def logged_in(blueprint, token):
     
     user = save_user(user_claims)
     login_user(user)
+    # Tenant corpora are matched on the email domain, which only counts
+    # once the issuer has verified the address
+    session['email_verified'] = user_claims.get('email_verified') is True
     blueprint.token = token
     next_url = session.pop("next_url", None)
     if next_url is not None:
@@ -1,7 +1,19 @@
-from flask import render_template, request, jsonify, flash, redirect, url_for, session
-from app import app, db
+from flask import render_template, request, jsonify, flash, redirect, url_for, session, make_response
+from app import app, db, csrf
 from forms import DemoRequestForm, ChatForm
-from compliance_data import search_handbook, PREDEFINED_QA, COMPLIANCE_HANDBOOK
+from compliance_data import PREDEFINED_QA, COMPLIANCE_HANDBOOK
+import chat_service
+from chat_service import answer_question, chat_payload, search_payload
+from query_log import query_log
+from question_cache import question_cache
+from rate_limit import chat_admission
+from search_index import get_encoded_bundle, live_snapshot_count
+from corpus_registry import corpus_registry, DEFAULT_TENANT, DEFAULT_DOCUMENT
+from models import ComplianceSection
+from db_pool import pool_metrics
+from functools import wraps
+from dataclasses import asdict
+import hmac
 from replit_auth import require_login, make_replit_blueprint
 from flask_login import current_user
 import logging
@@ -19,9 +31,58 @@ def get_domain():
         domains = os.environ.get('REPLIT_DOMAINS', '')
         return domains.split(',')[0] if domains else 'localhost:5000'
 
+# Resolve the tenant whose corpus the current caller may search
+def current_tenant_id():
+    if current_user.is_authenticated:
+        return corpus_registry.tenant_for_email(current_user.email, session.get('email_verified', False))
+    return DEFAULT_TENANT
+
+# Protect admin API endpoints with the ADMIN_API_TOKEN bearer token
+def require_admin_token(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected = os.environ.get('ADMIN_API_TOKEN')
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not expected or not hmac.compare_digest(supplied.encode(), expected.encode()):
+            return jsonify({
+                'success': False,
+                'error': 'Admin authorization required.'
+            }), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+# Check that a JSON value is a list of strings
+def is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
 # Register the Replit Auth blueprint
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
+# Endpoints guarded by chat admission control
+RATE_LIMITED_ENDPOINTS = {'chat'}
+
+def admit_chat_request():
+    """Refuse over-budget chat requests before any form parsing or search work"""
+    if request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+
+    # The signed session cookie identifies logged-in users without a DB lookup
+    admission = chat_admission.admit(request.remote_addr or 'unknown', session.get('_user_id'))
+    if admission.allowed:
+        return None
+
+    response = jsonify({
+        'success': False,
+        'error': 'Too many questions. Please wait a moment and try again.'
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(admission.retry_after)
+    return response
+
+# Run admission control ahead of CSRF checks and the other request hooks
+app.before_request_funcs.setdefault(None, []).insert(0, admit_chat_request)
+
 # Make session permanent
 @app.before_request
 def make_session_permanent():
@@ -74,22 +135,11 @@ def chat():
         question = chat_form.question.data
         
         if question:
-            # Search for answers in the compliance handbook
-            results = search_handbook(question)
-        
-            if results:
-                result = results[0]
-                return jsonify({
-                    'success': True,
-                    'question': question,
-                    'answer': result.answer,
-                    'sources': result.sources or []
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'No relevant information found.'
-                })
+            # Search for answers in the caller's compliance corpus
+            tenant_id = current_tenant_id()
+            query_log.record(question, tenant_id)
+            answer, cached = answer_question(question, tenant_id)
+            return jsonify(chat_payload(question, answer, cached))
         else:
             return jsonify({
                 'success': False,
@@ -112,6 +162,136 @@ def get_predefined_question():
         'sources': question.sources
     })
 
+@app.route('/api/question-cache')
+def question_cache_stats():
+    """Report near-duplicate question cache size, hit rate and boot warm-up"""
+    stats = question_cache.stats()
+    report = chat_service.warm_up_report
+    stats['warmup'] = asdict(report) if report else None
+    return jsonify(stats)
+
+@app.route('/admin/db-pool')
+@require_admin_token
+def db_pool_stats():
+    """Report connection pool usage, checkout waits and recycles"""
+    return jsonify(pool_metrics.snapshot(db.engine.pool))
+
+@app.route('/api/search')
+def api_search():
+    """Return the top-k ranked handbook sections and sentences for a query"""
+    query = request.args.get('q', '').strip()
+    k = request.args.get('k', 5, type=int)
+    offset = request.args.get('offset', 0, type=int)
+
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'Query is required.'
+        }), 400
+
+    return jsonify(search_payload(query, k, offset, current_tenant_id()))
+
+@app.route('/api/search-bundle')
+def search_bundle():
+    """Serve the precomputed handbook search bundle for client-side answering"""
+    # The bundle covers only the built-in handbook; callers whose corpus holds
+    # anything else, such as a tenant's own documents, must ask the server
+    corpus = corpus_registry.get(current_tenant_id())
+    if corpus.tenant_id != DEFAULT_TENANT or set(corpus.shards) != {DEFAULT_DOCUMENT}:
+        response = make_response('', 204)
+        response.headers['Vary'] = 'Cookie'
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+
+    bundle = get_encoded_bundle(corpus.shards[DEFAULT_DOCUMENT])
+
+    gzipped = 'gzip' in request.accept_encodings
+    etag = bundle.gzip_etag if gzipped else bundle.etag
+
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    elif gzipped:
+        response = make_response(bundle.gzipped)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(bundle.body)
+
+    response.set_etag(etag)
+    response.mimetype = 'application/json'
+    # Whether a bundle is served depends on who is signed in
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    response.headers['Cache-Control'] = 'private, max-age=300, must-revalidate'
+    return response
+
+@app.route('/admin/corpus/<tenant_id>/<document_id>/sections', methods=['POST'])
+@csrf.exempt
+@require_admin_token
+def admin_update_sections(tenant_id, document_id):
+    """Add, replace or delete sections of one corpus document without a rebuild"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    upsert_items = payload.get('upsert', [])
+    deletes = payload.get('delete', [])
+
+    if not is_string_list(deletes):
+        return jsonify({
+            'success': False,
+            'error': 'delete must be a list of section titles.'
+        }), 400
+
+    if not isinstance(upsert_items, list) or not all(
+            isinstance(item, dict)
+            and isinstance(item.get('title'), str)
+            and isinstance(item.get('content'), str)
+            and is_string_list(item.get('subsections', []))
+            for item in upsert_items):
+        return jsonify({
+            'success': False,
+            'error': 'upsert must be a list of sections, each with a title and content.'
+        }), 400
+
+    try:
+        upserts = [ComplianceSection(
+            title=item['title'],
+            content=item['content'],
+            page_number=int(item.get('page_number', 1)),
+            subsections=item.get('subsections', [])
+        ) for item in upsert_items]
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'page_number must be an integer.'
+        }), 400
+
+    if not upserts and not deletes:
+        return jsonify({
+            'success': False,
+            'error': 'Nothing to update.'
+        }), 400
+
+    try:
+        shard = corpus_registry.update_document(tenant_id, document_id, upserts, deletes)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except KeyError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown section: {e.args[0]}'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'tenant': tenant_id,
+        'document': document_id,
+        'version': shard.version,
+        'sections': len(shard.live_sections()),
+        'live_snapshots': live_snapshot_count()
+    })
+
 @app.route('/create-checkout-session', methods=['POST'])
 def create_checkout_session():
     """Create Stripe checkout session"""
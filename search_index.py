@@ -0,0 +1,536 @@
+"""
+Precomputed search index over the compliance handbook.
+
+The index splits every section into sentences, records their character
+offsets inside the section content and keeps an inverted index from
+normalized terms to the sentences that contain them. It backs the
+compact search bundle that the demo chat downloads to answer questions
+in the browser.
+"""
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import math
+import re
+import weakref
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from models import ComplianceSection, ChatMessage
+
+# Bump whenever the bundle layout changes so cached clients refetch
+BUNDLE_VERSION = 2
+
+# Minimum share of query terms a section must cover to answer locally
+MIN_COVERAGE = 0.6
+# Minimum share of a predefined question's terms the query must contain
+MIN_QA_OVERLAP = 0.6
+
+# Trigrams shared by more than this share of the vocabulary carry little
+# signal and are skipped when collecting correction candidates
+MAX_TRIGRAM_SHARE = 0.1
+MIN_TRIGRAM_CAP = 50
+# Only the candidates with the most shared trigrams get an edit-distance check
+MAX_CORRECTION_CANDIDATES = 20
+# Terms this short are too ambiguous to correct
+MIN_CORRECTABLE_LENGTH = 4
+# Extra weight for query terms that appear in a section title
+TITLE_BONUS = 0.5
+# A typo-corrected term keeps this share of its weight per edit, so a
+# query term found verbatim always outranks one that had to be corrected
+CORRECTION_WEIGHT = 0.8
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_ALNUM_SPLIT_RE = re.compile(r"[a-z]+|[0-9]+")
+# Sentences end at a period followed by whitespace or at the end of a line;
+# a leading bullet marker is not part of the sentence.
+_LINE_RE = re.compile(r"^[ \t]*(?:- )?(\S.*?)[ \t]*$", re.M)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=\.)\s+")
+
+# Snapshots are reclaimed by reference counting once no reader holds them;
+# these weak references only observe that and never keep one alive.
+_live_snapshots: "weakref.WeakSet[HandbookIndex]" = weakref.WeakSet()
+_encoded_bundles: "weakref.WeakKeyDictionary[HandbookIndex, EncodedBundle]" = weakref.WeakKeyDictionary()
+
+STOPWORDS = frozenset("""
+a about all an and any are as at be by can do does for from has have how i
+in is it its of on or our that the their this to we what when where which
+who why will with you your vaultlogic
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase the text and split it into alphanumeric terms."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def query_terms(text: str) -> List[str]:
+    """Distinct non-stopword terms of a query, in order of appearance."""
+    seen = []
+    for term in tokenize(text):
+        if term not in STOPWORDS and term not in seen:
+            seen.append(term)
+    return seen
+
+
+def trigrams(term: str) -> List[str]:
+    """Character trigrams of a term padded with boundary markers."""
+    padded = f"${term}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance between a and b, counting adjacent
+    transpositions as one edit. Returns limit + 1 as soon as the distance
+    is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    Character-trigram index over a vocabulary for typo-tolerant lookups.
+    Candidates are gathered from the posting lists of the query's trigrams,
+    rarest first, so the work done depends on how many terms share trigrams
+    with the query rather than on the size of the vocabulary.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int]):
+        # vocabulary maps each term to a frequency used to break ties
+        self.frequencies: Dict[str, int] = dict(vocabulary)
+        self.postings: Dict[str, List[str]] = {}
+        for term in sorted(self.frequencies):
+            for gram in set(trigrams(term)):
+                self.postings.setdefault(gram, []).append(term)
+        self.max_postings = max(MIN_TRIGRAM_CAP, int(len(self.frequencies) * MAX_TRIGRAM_SHARE))
+
+    def updated(self, changes: Dict[str, int]) -> "TrigramIndex":
+        """
+        Return a new index with the given term frequencies applied, where a
+        frequency of zero removes the term. Only the posting lists of trigrams
+        of added or removed terms are copied; the rest are shared.
+        """
+        new = TrigramIndex.__new__(TrigramIndex)
+        new.frequencies = dict(self.frequencies)
+        new.postings = dict(self.postings)
+        copied = set()
+        for term, frequency in changes.items():
+            known = term in self.frequencies
+            if frequency:
+                new.frequencies[term] = frequency
+            else:
+                new.frequencies.pop(term, None)
+            if known == bool(frequency):
+                continue
+            for gram in set(trigrams(term)):
+                if gram not in copied:
+                    new.postings[gram] = list(new.postings.get(gram, ()))
+                    copied.add(gram)
+                if frequency:
+                    new.postings.setdefault(gram, []).append(term)
+                else:
+                    new.postings[gram].remove(term)
+                    if not new.postings[gram]:
+                        del new.postings[gram]
+        new.max_postings = max(MIN_TRIGRAM_CAP, int(len(new.frequencies) * MAX_TRIGRAM_SHARE))
+        return new
+
+    def nearest(self, term: str, max_distance: int = 2) -> Optional[Tuple[str, int]]:
+        """Return the closest vocabulary term within max_distance edits and its distance."""
+        grams = sorted(
+            (gram for gram in set(trigrams(term)) if gram in self.postings),
+            key=lambda gram: len(self.postings[gram]),
+        )
+        if not grams:
+            return None
+
+        overlap = Counter()
+        for position, gram in enumerate(grams):
+            posting = self.postings[gram]
+            # Always use the rarest trigram so very common ones can be pruned
+            if position and len(posting) > self.max_postings:
+                break
+            overlap.update(posting)
+
+        best = None
+        for candidate, _ in overlap.most_common(MAX_CORRECTION_CANDIDATES):
+            distance = edit_distance(term, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            rank = (distance, -self.frequencies[candidate], candidate)
+            if best is None or rank < best:
+                best = rank
+        return (best[2], best[0]) if best else None
+
+
+def top_k(term_postings: List[Tuple[List[int], Callable[[int], float], float]],
+          k: int) -> List[Tuple[int, float]]:
+    """
+    Return the k highest scoring ids as (id, score) pairs, best first.
+
+    Each entry of term_postings is (sorted ids, weight function, upper bound
+    of the weight) for one query term. Terms are accumulated from the highest
+    bound down; once the k-th best score exceeds the summed bounds of the
+    remaining terms, no unseen id can enter the top k and the remaining
+    postings are only probed for existing candidates. Candidates that cannot
+    reach the k-th score are dropped as soon as that is known.
+    """
+    if k <= 0:
+        return []
+    ordered = sorted(term_postings, key=lambda entry: -entry[2])
+    remaining = [0.0] * (len(ordered) + 1)
+    for position in range(len(ordered) - 1, -1, -1):
+        remaining[position] = remaining[position + 1] + ordered[position][2]
+
+    scores: Dict[int, float] = {}
+    for position, (ids, weight, _) in enumerate(ordered):
+        threshold = heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+        # An unseen id that could only tie the k-th score may still win the
+        # tie on its lower id, so it is admitted too
+        if len(scores) < k or threshold <= remaining[position]:
+            for doc_id in ids:
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight(doc_id)
+            continue
+        # No new id can be admitted; prune candidates that cannot catch up
+        scores = {
+            doc_id: score for doc_id, score in scores.items()
+            if score + remaining[position] >= threshold
+        }
+        for doc_id in scores:
+            index = bisect.bisect_left(ids, doc_id)
+            if index < len(ids) and ids[index] == doc_id:
+                scores[doc_id] += weight(doc_id)
+
+    return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+@dataclass
+class Sentence:
+    section_id: int
+    start: int
+    end: int
+    text: str
+    # Character offsets of each term inside text, for highlighting
+    offsets: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+
+
+class HandbookIndex:
+    """
+    Inverted index from terms to handbook sentences.
+
+    An index is treated as an immutable snapshot once built: apply() returns
+    a new snapshot that shares every posting list the change does not touch.
+    Deleted sections and their sentences leave None placeholders so the ids
+    of everything else stay stable.
+    """
+
+    def __init__(self, sections: Iterable[ComplianceSection] = ()):
+        self.version = 0
+        self.sections: List[Optional[ComplianceSection]] = []
+        self.sources: List[Optional[str]] = []
+        self.title_terms: List[List[str]] = []
+        self.section_sentences: List[List[int]] = []
+        self.sentences: List[Optional[Sentence]] = []
+        self.sentence_count = 0
+        self.postings: Dict[str, List[int]] = {}
+        self.section_postings: Dict[str, List[int]] = {}
+
+        for section in sections:
+            self._add_section(section, None)
+        self.trigrams = TrigramIndex({term: len(ids) for term, ids in self.postings.items()})
+        _live_snapshots.add(self)
+
+    def __setstate__(self, state):
+        # Shards loaded from disk are snapshots too
+        self.__dict__.update(state)
+        _live_snapshots.add(self)
+
+    def _own(self, mapping: Dict[str, List[int]], term: str, copied: Optional[set]) -> List[int]:
+        # Copy a shared posting list the first time this snapshot changes it
+        if copied is not None and (id(mapping), term) not in copied:
+            mapping[term] = list(mapping.get(term, ()))
+            copied.add((id(mapping), term))
+        return mapping.setdefault(term, [])
+
+    def _add_section(self, section: ComplianceSection, copied: Optional[set]) -> None:
+        section_id = len(self.sections)
+        self.sections.append(section)
+        self.sources.append(f"{section.title} - Page {section.page_number}")
+        self.title_terms.append(query_terms(section.title))
+        sentence_ids = []
+        for start, end in split_sentences(section.content):
+            sentence_id = len(self.sentences)
+            text = section.content[start:end]
+            offsets: Dict[str, List[Tuple[int, int]]] = {}
+            for match in _TOKEN_RE.finditer(text.lower()):
+                offsets.setdefault(match.group(), []).append(match.span())
+            self.sentences.append(Sentence(section_id, start, end, text, offsets))
+            sentence_ids.append(sentence_id)
+            for term in offsets:
+                self._own(self.postings, term, copied).append(sentence_id)
+                section_ids = self._own(self.section_postings, term, copied)
+                if not section_ids or section_ids[-1] != section_id:
+                    section_ids.append(section_id)
+        self.section_sentences.append(sentence_ids)
+        self.sentence_count += len(sentence_ids)
+
+    def _remove_section(self, section_id: int, copied: set) -> None:
+        for sentence_id in self.section_sentences[section_id]:
+            for term in self.sentences[sentence_id].offsets:
+                postings = self._own(self.postings, term, copied)
+                postings.remove(sentence_id)
+                if not postings:
+                    del self.postings[term]
+                # The term recurs in later sentences of the section; only
+                # the first removes the section, without recreating the list
+                if section_id in self.section_postings.get(term, ()):
+                    section_ids = self._own(self.section_postings, term, copied)
+                    section_ids.remove(section_id)
+                    if not section_ids:
+                        del self.section_postings[term]
+            self.sentences[sentence_id] = None
+        self.sentence_count -= len(self.section_sentences[section_id])
+        self.sections[section_id] = None
+        self.sources[section_id] = None
+        self.title_terms[section_id] = []
+        self.section_sentences[section_id] = []
+
+    def live_sections(self) -> List[ComplianceSection]:
+        """Sections that have not been deleted, in index order."""
+        return [section for section in self.sections if section is not None]
+
+    def apply(self, upserts: Iterable[ComplianceSection] = (),
+              deletes: Iterable[str] = ()) -> "HandbookIndex":
+        """
+        Return a new snapshot with sections added, replaced or deleted by title.
+        Only the postings of terms in the affected sections are rebuilt; this
+        snapshot is left untouched so concurrent readers keep a consistent view.
+        Raises KeyError if a title to delete is not in the index.
+        """
+        upserts = list({section.title: section for section in upserts}.values())
+        titles = {section.title: section_id
+                  for section_id, section in enumerate(self.sections) if section is not None}
+        removals = []
+        for title in deletes:
+            if title not in titles:
+                raise KeyError(title)
+            removals.append(titles[title])
+        removals.extend(titles[section.title] for section in upserts if section.title in titles)
+
+        new = HandbookIndex.__new__(HandbookIndex)
+        new.version = self.version + 1
+        new.sections = list(self.sections)
+        new.sources = list(self.sources)
+        new.title_terms = list(self.title_terms)
+        new.section_sentences = list(self.section_sentences)
+        new.sentences = list(self.sentences)
+        new.sentence_count = self.sentence_count
+        new.postings = dict(self.postings)
+        new.section_postings = dict(self.section_postings)
+
+        copied: set = set()
+        for section_id in sorted(set(removals)):
+            new._remove_section(section_id, copied)
+        for section in upserts:
+            new._add_section(section, copied)
+
+        changed_terms = {term for mapping_id, term in copied if mapping_id == id(new.postings)}
+        new.trigrams = self.trigrams.updated(
+            {term: len(new.postings.get(term, ())) for term in changed_terms}
+        )
+        _live_snapshots.add(new)
+        return new
+
+    def idf(self, term: str) -> float:
+        """Smoothed inverse sentence frequency of a term."""
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + self.sentence_count / (1 + df))
+
+    def resolve_term(self, term: str) -> List[Tuple[str, float]]:
+        """
+        Map a query term onto the index vocabulary as (term, weight factor)
+        pairs. Known terms are kept, glued letter/digit runs such as
+        "iso27001" are split, and other unknown terms are replaced by their
+        nearest trigram match at a weight reduced by its edit distance.
+        """
+        if term in self.postings:
+            return [(term, 1.0)]
+        parts = _ALNUM_SPLIT_RE.findall(term)
+        if len(parts) > 1 and all(part in self.postings for part in parts):
+            return [(part, 1.0) for part in parts]
+        if len(term) < MIN_CORRECTABLE_LENGTH or term.isdigit():
+            return []
+        max_distance = 1 if len(term) <= 5 else 2
+        corrected = self.trigrams.nearest(term, max_distance)
+        if not corrected:
+            return []
+        match, distance = corrected
+        return [(match, CORRECTION_WEIGHT ** distance)]
+
+    def term_weights(self, query: str) -> Dict[str, float]:
+        """
+        Distinct query terms after stopword removal and typo correction,
+        in query order, mapped to their weight factor.
+        """
+        weights: Dict[str, float] = {}
+        for term in query_terms(query):
+            for match, factor in self.resolve_term(term):
+                if match not in STOPWORDS:
+                    weights[match] = max(weights.get(match, 0.0), factor)
+        return weights
+
+    def resolve_terms(self, query: str) -> List[str]:
+        """Distinct query terms after stopword removal and typo correction."""
+        return list(self.term_weights(query))
+
+    def top_sections(self, terms: Dict[str, float], k: int) -> List[Tuple[int, float]]:
+        """Top k sections by the weighted idf of the query terms they contain."""
+        entries = []
+        for term, factor in terms.items():
+            if term not in self.section_postings:
+                continue
+            idf = self.idf(term) * factor
+
+            def weight(section_id, term=term, idf=idf):
+                bonus = TITLE_BONUS if term in self.title_terms[section_id] else 0.0
+                return idf * (1 + bonus)
+
+            entries.append((self.section_postings[term], weight, idf * (1 + TITLE_BONUS)))
+        return top_k(entries, k)
+
+    def top_sentences(self, terms: Dict[str, float], k: int) -> List[Tuple[int, float]]:
+        """Top k sentences by the weighted idf of the query terms they contain."""
+        entries = []
+        for term, factor in terms.items():
+            if term in self.postings:
+                idf = self.idf(term) * factor
+                entries.append((self.postings[term], lambda _, idf=idf: idf, idf))
+        return top_k(entries, k)
+
+    def highlights(self, sentence_id: int, terms: Iterable[str]) -> List[Tuple[int, int]]:
+        """Sorted character offsets of the query terms inside a sentence."""
+        offsets = self.sentences[sentence_id].offsets
+        return sorted(span for term in terms for span in offsets.get(term, ()))
+
+    def best_sentences(self, section_id: int, terms: Dict[str, float], limit: int = 3) -> List[int]:
+        """Ids of the highest scoring sentences of a section, in document order."""
+        scores: Dict[int, float] = {}
+        for term, factor in terms.items():
+            idf = self.idf(term) * factor
+            for sentence_id in self.postings.get(term, ()):
+                if self.sentences[sentence_id].section_id == section_id:
+                    scores[sentence_id] = scores.get(sentence_id, 0.0) + idf
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))[:limit]
+        return sorted(ranked)
+
+    def answer_text(self, sentence_ids: List[int]) -> str:
+        """Join sentences into an answer, terminating bullet fragments."""
+        return " ".join(as_sentence(self.sentences[i].text) for i in sentence_ids)
+
+
+def as_sentence(text: str) -> str:
+    """Terminate a sentence fragment with a period unless already punctuated."""
+    text = text.rstrip(":")
+    return text if text.endswith((".", "!", "?")) else text + "."
+
+
+def split_sentences(content: str) -> List[tuple]:
+    """Return (start, end) character offsets of the sentences in content."""
+    spans = []
+    for line in _LINE_RE.finditer(content):
+        offset = line.start(1)
+        for part in _SENTENCE_SPLIT_RE.split(line.group(1)):
+            if part:
+                start = content.index(part, offset)
+                spans.append((start, start + len(part)))
+                offset = start + len(part)
+    return spans
+
+
+def build_search_bundle(index: HandbookIndex,
+                        predefined_qa: Optional[List[ChatMessage]] = None) -> dict:
+    """
+    Build the compact, JSON-serializable bundle used for client-side search.
+    Terms are sorted so clients can binary-search them, and postings[i] lists
+    the sentence ids that contain terms[i].
+    """
+    if index.sentence_count != len(index.sentences):
+        # Drop the placeholders left by deleted sections so ids stay dense
+        index = HandbookIndex(index.live_sections())
+    terms = sorted(index.postings)
+    return {
+        "version": BUNDLE_VERSION,
+        "min_coverage": MIN_COVERAGE,
+        "min_qa_overlap": MIN_QA_OVERLAP,
+        "title_bonus": TITLE_BONUS,
+        "stopwords": sorted(STOPWORDS),
+        "terms": terms,
+        "postings": [index.postings[term] for term in terms],
+        "sentences": [[s.section_id, s.text] for s in index.sentences],
+        "sources": index.sources,
+        "titles": index.title_terms,
+        # Predefined questions carry their terms as the server resolves them
+        "qa": [[qa.question, qa.answer, qa.sources, index.resolve_terms(qa.question)]
+               for qa in predefined_qa or []],
+    }
+
+
+@dataclass
+class EncodedBundle:
+    body: bytes
+    gzipped: bytes
+    etag: str
+    # The gzip coding is a separate representation with its own validator
+    gzip_etag: str
+
+
+def encode_bundle(bundle: dict) -> EncodedBundle:
+    """Serialize a bundle and precompute its gzip body and strong ETags."""
+    body = json.dumps(bundle, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    # mtime=0 keeps the compressed bytes identical across workers
+    gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+    etag = f"v{BUNDLE_VERSION}-{digest}"
+    return EncodedBundle(body=body, gzipped=gzipped, etag=etag, gzip_etag=f"{etag}-gz")
+
+
+@lru_cache(maxsize=1)
+def get_handbook_index() -> HandbookIndex:
+    """Build and cache the index over the built-in compliance handbook."""
+    from compliance_data import COMPLIANCE_HANDBOOK
+    return HandbookIndex(COMPLIANCE_HANDBOOK["sections"])
+
+
+def get_encoded_bundle(index: HandbookIndex) -> EncodedBundle:
+    """Build, or reuse, the encoded demo chat search bundle of an index snapshot."""
+    bundle = _encoded_bundles.get(index)
+    if bundle is None:
+        from compliance_data import PREDEFINED_QA
+        bundle = encode_bundle(build_search_bundle(index, PREDEFINED_QA))
+        _encoded_bundles[index] = bundle
+    return bundle
+
+
+def live_snapshot_count() -> int:
+    """Number of index snapshots still referenced by the registry or a request."""
+    return len(_live_snapshots)
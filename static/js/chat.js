@@ -5,6 +5,7 @@
 
     let chatMessages = [];
     let isTyping = false;
+    let searchBundle = null;
 
     document.addEventListener('DOMContentLoaded', function() {
         initializeChat();
@@ -25,6 +26,9 @@
 
         // Initialize predefined questions
         initPredefinedQuestions(predefinedButtons, questionInput);
+
+        // Load the offline search bundle so most questions are answered locally
+        loadSearchBundle();
         
         // Handle form submission
         chatForm.addEventListener('submit', handleChatSubmission);
@@ -92,6 +96,13 @@
             questionInput.style.height = 'auto';
         }
 
+        // Answer locally when the offline bundle has a confident match
+        const localResult = searchLocally(question);
+        if (localResult) {
+            handleChatResponse(localResult);
+            return;
+        }
+
         // Show typing indicator
         showTypingIndicator();
         
@@ -116,6 +127,119 @@
         });
     }
 
+    function loadSearchBundle() {
+        fetch('/api/search-bundle')
+            // 204 means this user's corpus must be searched on the server
+            .then(response => response.status === 200 ? response.json() : null)
+            .then(bundle => {
+                if (bundle && bundle.terms && bundle.postings) {
+                    searchBundle = bundle;
+                }
+            })
+            .catch(error => {
+                console.warn('Offline search unavailable, using server search:', error);
+            });
+    }
+
+    function bundleQueryTerms(text) {
+        const stopwords = new Set(searchBundle.stopwords || []);
+        const terms = [];
+        (text.toLowerCase().match(/[a-z0-9]+/g) || []).forEach(term => {
+            if (!stopwords.has(term) && !terms.includes(term)) {
+                terms.push(term);
+            }
+        });
+        return terms;
+    }
+
+    function findBundleTerm(term) {
+        // Terms are sorted, so binary-search the dictionary
+        const terms = searchBundle.terms;
+        let low = 0;
+        let high = terms.length - 1;
+        while (low <= high) {
+            const mid = (low + high) >> 1;
+            if (terms[mid] === term) return mid;
+            if (terms[mid] < term) low = mid + 1;
+            else high = mid - 1;
+        }
+        return -1;
+    }
+
+    function asSentence(text) {
+        // Terminate bullet fragments the same way the server does
+        const trimmed = text.replace(/:+$/, '');
+        return /[.!?]$/.test(trimmed) ? trimmed : trimmed + '.';
+    }
+
+    function searchLocally(question) {
+        if (!searchBundle) return null;
+
+        const terms = bundleQueryTerms(question);
+        if (terms.length === 0) return null;
+
+        // Predefined answers win when the question closely matches one; like
+        // the server, only compare terms that are in the handbook vocabulary
+        const knownTerms = terms.filter(term => findBundleTerm(term) >= 0);
+        for (const [, qaAnswer, qaSources, qaTerms] of searchBundle.qa || []) {
+            const shared = qaTerms.filter(term => knownTerms.includes(term)).length;
+            if (qaTerms.length && shared / qaTerms.length >= searchBundle.min_qa_overlap) {
+                return { success: true, question, answer: qaAnswer, sources: qaSources, local: true };
+            }
+        }
+
+        const sentenceCount = searchBundle.sentences.length;
+        const sentenceScores = new Map();
+        const sectionScores = new Map();
+        const sectionTerms = new Map();
+
+        terms.forEach(term => {
+            const termId = findBundleTerm(term);
+            if (termId < 0) return;
+            const postings = searchBundle.postings[termId];
+            const idf = Math.log(1 + sentenceCount / (1 + postings.length));
+            postings.forEach(sentenceId => {
+                sentenceScores.set(sentenceId, (sentenceScores.get(sentenceId) || 0) + idf);
+                const sectionId = searchBundle.sentences[sentenceId][0];
+                if (!sectionTerms.has(sectionId)) sectionTerms.set(sectionId, new Set());
+                if (sectionTerms.get(sectionId).has(term)) return;
+                sectionTerms.get(sectionId).add(term);
+                // Score sections like the server: idf per term, boosted when it is in the title
+                const bonus = searchBundle.titles[sectionId].includes(term) ? searchBundle.title_bonus : 0;
+                sectionScores.set(sectionId, (sectionScores.get(sectionId) || 0) + idf * (1 + bonus));
+            });
+        });
+
+        // Pick the highest scoring section, breaking ties by position as the server does
+        let bestSection = -1;
+        let bestScore = 0;
+        sectionScores.forEach((score, sectionId) => {
+            if (score > bestScore || (score === bestScore && sectionId < bestSection)) {
+                bestScore = score;
+                bestSection = sectionId;
+            }
+        });
+
+        if (bestSection < 0 || sectionTerms.get(bestSection).size / terms.length < searchBundle.min_coverage) {
+            return null;
+        }
+
+        const topSentences = [...sentenceScores.entries()]
+            .filter(([sentenceId]) => searchBundle.sentences[sentenceId][0] === bestSection)
+            .sort((a, b) => b[1] - a[1] || a[0] - b[0])
+            .slice(0, 3)
+            .map(([sentenceId]) => sentenceId)
+            .sort((a, b) => a - b);
+
+        return {
+            success: true,
+            question,
+            answer: topSentences.map(sentenceId => asSentence(searchBundle.sentences[sentenceId][1])).join(' '),
+            sources: [searchBundle.sources[bestSection]],
+            local: true
+        };
+    }
+
     function handleChatResponse(data) {
         if (data.success) {
             const answer = data.answer;
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time, so point every store at a
+# scratch directory before any test module imports it
+_scratch = tempfile.mkdtemp(prefix="vaultlogic-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'app.db')}")
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+os.environ.setdefault("REPL_ID", "test-repl")
+os.environ.setdefault("CORPUS_DIR", os.path.join(_scratch, "corpus"))
+os.environ.setdefault("CHAT_RATE_LIMIT_DB", os.path.join(_scratch, "rate-limit.sqlite3"))
+os.environ.setdefault("QUERY_LOG_DB", os.path.join(_scratch, "query-log.sqlite3"))
+os.environ.setdefault("WARMUP_BUDGET_SECONDS", "0")
+
+try:
+    # Import the app before anything imports models, as production does;
+    # otherwise create_all runs while models is only half imported
+    import main  # noqa: F401
+except ImportError:
+    # Test modules skip themselves when the app's dependencies are missing
+    pass
+
+
+@pytest.fixture
+def client():
+    from main import app
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.test_client() as client:
+        yield client
+    app.config["WTF_CSRF_ENABLED"] = True
@@ -0,0 +1,171 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+pytest.importorskip("asgiref")
+
+import asgi  # noqa: E402
+import routes  # noqa: E402
+from compliance_data import search_handbook  # noqa: E402
+from rate_limit import BucketSpec, ChatAdmissionController, TokenBucketStore  # noqa: E402
+
+QUESTIONS = ["Do you encrypt data at rest?", "Are you HIPAA compliant?", "Do you have a disaster recovery plan?"]
+
+
+@pytest.fixture(autouse=True)
+def limiter(tmp_path, monkeypatch):
+    # A fresh limiter per test, so tests never drain each other's buckets
+    limiter = ChatAdmissionController(
+        store=TokenBucketStore(str(tmp_path / "buckets.sqlite3")),
+        ip=BucketSpec(rate=0.01, burst=5),
+        user=BucketSpec(rate=3, burst=30),
+        anonymous_pool=BucketSpec(rate=20, burst=40),
+        authenticated_pool=BucketSpec(rate=20, burst=40),
+    )
+    monkeypatch.setattr(asgi, "chat_admission", limiter)
+    monkeypatch.setattr(routes, "chat_admission", limiter)
+    return limiter
+
+
+def request(method, path, body=b"", headers=()):
+    """Drive asgi.app through one request and return (status, headers, body)."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"content-length", str(len(body)).encode())]
+        + [(name.encode(), value.encode()) for name, value in headers],
+        "client": ("203.0.113.7", 40000), "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def receive():
+        if not messages:
+            messages.append(None)
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client stays connected until the response is complete
+        await asyncio.Event().wait()
+
+    response = {"status": None, "headers": {}, "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {name.decode().lower(): value.decode() for name, value in message["headers"]}
+        else:
+            response["body"] += message.get("body", b"")
+
+    asyncio.run(asgi.app(scope, receive, send))
+    return response["status"], response["headers"], response["body"]
+
+
+def post_json(path, payload, headers=()):
+    return request("POST", path, json.dumps(payload).encode(), [("content-type", "application/json")] + list(headers))
+
+
+def test_process_mode_keeps_the_cache_in_the_parent(monkeypatch):
+    offloaded = []
+
+    async def run_retrieval(function, *args):
+        offloaded.append(function)
+        return function(*args)
+
+    monkeypatch.setattr(asgi, "SEARCH_EXECUTOR", "process")
+    monkeypatch.setattr(asgi, "run_retrieval", run_retrieval)
+    question = "How often are access reviews for production systems performed?"
+
+    first, first_cached = asyncio.run(asgi.answer_on_pool(question, "default"))
+    second, second_cached = asyncio.run(asgi.answer_on_pool(question, "default"))
+
+    assert first is not None and not first_cached
+    assert second is first and second_cached
+    # Only the search crossed to the pool; the second answer came from the parent's cache
+    assert offloaded == [search_handbook]
+
+
+def test_process_pool_forks_its_workers_at_startup(monkeypatch):
+    monkeypatch.setattr(asgi, "SEARCH_EXECUTOR", "process")
+    monkeypatch.setattr(asgi, "SEARCH_WORKERS", 2)
+    monkeypatch.setattr(asgi, "_executor", None)
+    messages = asyncio.Queue()
+    forked_before_complete = []
+
+    async def send(message):
+        if message["type"] == "lifespan.startup.complete":
+            forked_before_complete.append(len(asgi._executor._processes))
+            await messages.put({"type": "lifespan.shutdown"})
+
+    async def run():
+        await messages.put({"type": "lifespan.startup"})
+        await asgi.app({"type": "lifespan"}, messages.get, send)
+
+    asyncio.run(run())
+    assert forked_before_complete == [2]
+
+
+def test_batch_answers_come_back_in_question_order():
+    status, _, body = post_json("/chat/batch", {"questions": QUESTIONS})
+    answers = json.loads(body)["answers"]
+    assert status == 200
+    assert [answer["question"] for answer in answers] == QUESTIONS
+    assert [answer["sources"] for answer in answers] == [search_handbook(q)[0].sources for q in QUESTIONS]
+
+
+def test_stream_sends_one_event_per_answer_then_done():
+    status, headers, body = post_json("/chat/stream", {"questions": QUESTIONS})
+    assert status == 200
+    assert headers["content-type"] == "text/event-stream"
+
+    events = [chunk.split("\n") for chunk in body.decode().split("\n\n") if chunk]
+    assert all(len(lines) == 2 and lines[0].startswith("event: ") and lines[1].startswith("data: ")
+               for lines in events)
+    names = [lines[0][len("event: "):] for lines in events]
+    payloads = [json.loads(lines[1][len("data: "):]) for lines in events]
+    assert names == ["answer"] * len(QUESTIONS) + ["done"]
+    assert sorted(payload["index"] for payload in payloads[:-1]) == [0, 1, 2]
+    assert all(payload["question"] == QUESTIONS[payload["index"]] for payload in payloads[:-1])
+    assert payloads[-1] == {"count": len(QUESTIONS)}
+
+
+def test_oversized_batch_is_refused_without_retry_after():
+    status, headers, body = post_json("/chat/batch", {"questions": QUESTIONS * 2})
+    assert status == 413
+    assert "retry-after" not in headers
+    assert json.loads(body)["success"] is False
+
+
+def test_exhausted_bucket_gets_retry_after():
+    assert post_json("/chat/batch", {"questions": QUESTIONS})[0] == 200
+    status, headers, _ = post_json("/chat/batch", {"questions": QUESTIONS})
+    assert status == 429
+    assert int(headers["retry-after"]) >= 1
+
+
+def test_cross_origin_json_is_refused():
+    status, _, _ = post_json("/chat", {"question": QUESTIONS[0]}, [("origin", "https://evil.example")])
+    assert status == 403
+    status, _, _ = post_json("/chat", {"question": QUESTIONS[0]}, [("origin", "http://testserver")])
+    assert status == 200
+
+
+def test_form_posted_chat_is_served_by_flask(monkeypatch):
+    native = []
+
+    async def chat(scope, receive, send):
+        native.append(scope["path"])
+        await asgi.send_json(send, 200, {"success": True, "native": True})
+
+    monkeypatch.setattr(asgi, "chat", chat)
+    monkeypatch.setitem(asgi.flask_app.config, "WTF_CSRF_ENABLED", False)
+
+    status, _, body = request("POST", "/chat", urlencode({"question": QUESTIONS[0]}).encode(),
+                              [("content-type", "application/x-www-form-urlencoded")])
+    assert status == 200
+    assert native == []
+    assert json.loads(body)["sources"] == search_handbook(QUESTIONS[0])[0].sources
+
+    post_json("/chat", {"question": QUESTIONS[0]})
+    assert native == ["/chat"]
@@ -0,0 +1,118 @@
+import copy
+import os
+import random
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+from corpus_registry import CorpusRegistry, DEFAULT_DOCUMENT, DEFAULT_TENANT  # noqa: E402
+from models import ComplianceSection  # noqa: E402
+from search_index import HandbookIndex, get_handbook_index  # noqa: E402
+
+
+POLICY = """Acceptable Use Policy
+
+Visitors must wear a lanyard at all times.
+"""
+
+
+def test_ingest_into_default_tenant_keeps_builtin_handbook(tmp_path):
+    policy = tmp_path / "policy.txt"
+    policy.write_text(POLICY)
+    registry = CorpusRegistry(str(tmp_path / "corpus"))
+
+    registry.ingest(DEFAULT_TENANT, [str(policy)], max_workers=1)
+
+    # A fresh registry only sees what was written to disk
+    corpus = CorpusRegistry(registry.root).get(DEFAULT_TENANT)
+    assert corpus.version is not None
+    assert set(corpus.shards) == {DEFAULT_DOCUMENT, "policy"}
+
+    shard, section_id, _, _ = corpus.top_sections("GDPR", 1)[0]
+    assert shard is corpus.shards[DEFAULT_DOCUMENT]
+    assert "GDPR" in shard.sections[section_id].title
+
+    shard, _, _, _ = corpus.top_sections("lanyard", 1)[0]
+    assert shard is corpus.shards["policy"]
+
+
+def canonical(index):
+    """The index with ids replaced by what they point at, so placeholders do not matter."""
+    def sentence(sentence_id):
+        entry = index.sentences[sentence_id]
+        return index.sections[entry.section_id].title, entry.start
+
+    return {
+        "sections": [(s.title, s.content, s.page_number) for s in index.live_sections()],
+        "sentence_count": index.sentence_count,
+        "postings": {term: [sentence(i) for i in ids] for term, ids in index.postings.items()},
+        "section_postings": {term: [index.sections[i].title for i in ids]
+                             for term, ids in index.section_postings.items()},
+        "trigram_frequencies": index.trigrams.frequencies,
+        "trigram_postings": {gram: sorted(terms) for gram, terms in index.trigrams.postings.items()},
+    }
+
+
+def raw_state(index):
+    return copy.deepcopy((index.sections, index.sentences, index.postings, index.section_postings,
+                          index.trigrams.frequencies, index.trigrams.postings, index.sentence_count))
+
+
+def random_section(rng, vocabulary, title):
+    sentences = [" ".join(rng.sample(vocabulary, rng.randint(3, 8))).capitalize() + "."
+                 for _ in range(rng.randint(1, 4))]
+    return ComplianceSection(title=title, content="\n".join(sentences), page_number=rng.randint(1, 20))
+
+
+def test_apply_matches_a_full_rebuild_and_leaves_the_snapshot_alone():
+    rng = random.Random(31)
+    index = get_handbook_index()
+    vocabulary = sorted(index.postings) + [f"newterm{n}" for n in range(20)]
+    for step in range(40):
+        titles = [section.title for section in index.live_sections()]
+        deletes = rng.sample(titles, min(len(titles), rng.randint(0, 2)))
+        upserts = [random_section(rng, vocabulary, title)
+                   for title in rng.sample(titles, min(len(titles), rng.randint(0, 2)))]
+        upserts += [random_section(rng, vocabulary, f"Added Section {step}-{n}") for n in range(rng.randint(0, 2))]
+        upserts = [section for section in upserts if section.title not in deletes]
+
+        before = raw_state(index)
+        updated = index.apply(upserts, deletes)
+
+        assert raw_state(index) == before
+        assert canonical(updated) == canonical(HandbookIndex(updated.live_sections()))
+        index = updated
+
+
+def test_update_document_is_picked_up_by_another_registry(tmp_path):
+    tenant = "acme.example"
+    writer = CorpusRegistry(str(tmp_path / "corpus"))
+    reader = CorpusRegistry(writer.root)
+
+    writer.update_document(tenant, "policy", upserts=[
+        ComplianceSection(title="Visitors", content="Visitors must wear a lanyard at all times.", page_number=1)])
+    first = reader.get(tenant)
+    assert first is reader.get(tenant)
+    assert first.top_sections("lanyard", 1)
+
+    writer.update_document(tenant, "policy", upserts=[
+        ComplianceSection(title="Visitors", content="Visitors must show a badge at reception.", page_number=1)])
+    second = reader.get(tenant)
+
+    # The marker changed, so the reader publishes a new snapshot; the old one is unchanged
+    assert second is not first
+    assert second.version == writer.get(tenant).version != first.version
+    assert second.cache_namespace != first.cache_namespace
+    assert second.top_sections("badge", 1) and not second.top_sections("lanyard", 1)
+    assert first.top_sections("lanyard", 1) and not first.top_sections("badge", 1)
+
+
+def test_only_verified_emails_are_routed_to_their_tenant(tmp_path):
+    registry = CorpusRegistry(str(tmp_path / "corpus"))
+    os.makedirs(registry.tenant_dir("acme.example"))
+
+    assert registry.tenant_for_email("jane@ACME.example", verified=True) == "acme.example"
+    assert registry.tenant_for_email("jane@acme.example", verified=False) == DEFAULT_TENANT
+    assert registry.tenant_for_email("jane@other.example", verified=True) == DEFAULT_TENANT
+    assert registry.tenant_for_email(None, verified=True) == DEFAULT_TENANT
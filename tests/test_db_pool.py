@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+import db_pool  # noqa: E402
+from db_pool import engine_options, pool_metrics, prewarm_pool  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_pool, "POOL_RECYCLE", 0)
+    monkeypatch.setattr(db_pool, "POOL_PING_AFTER_IDLE", 3600)
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'pool.db'}", **engine_options())
+    yield engine
+    engine.dispose()
+
+
+def counters():
+    return {name: getattr(pool_metrics, name) for name in ("checkouts", "connects", "recycles", "pings", "invalidations")}
+
+
+def delta(before):
+    return {name: value - before[name] for name, value in counters().items()}
+
+
+def select_one(engine):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text("SELECT 1")).scalar()
+
+
+def test_prewarm_opens_idle_connections(engine):
+    before = counters()
+    assert prewarm_pool(engine, 3) == 3
+    snapshot = pool_metrics.snapshot(engine.pool)
+    assert (snapshot["size"], snapshot["idle"], snapshot["in_use"], snapshot["overflow"]) == (5, 3, 0, 0)
+    assert delta(before)["connects"] == 3
+
+    # Pre-warm never opens more than the pool keeps
+    assert prewarm_pool(engine, 50) == 5
+
+
+def test_connections_are_recycled_at_their_age_limit(engine, monkeypatch):
+    monkeypatch.setattr(db_pool, "POOL_RECYCLE", 0.05)
+    before = counters()
+    assert select_one(engine) == 1
+    time.sleep(0.1)
+    assert select_one(engine) == 1
+    # The aged connection was replaced on checkout without counting as a failure
+    assert delta(before) == {"checkouts": 2, "connects": 2, "recycles": 1, "pings": 0, "invalidations": 0}
+
+
+def test_only_idle_connections_are_pinged(engine, monkeypatch):
+    monkeypatch.setattr(db_pool, "POOL_PING_AFTER_IDLE", 0.05)
+    before = counters()
+    select_one(engine)
+    select_one(engine)
+    assert delta(before)["pings"] == 0
+
+    time.sleep(0.1)
+    select_one(engine)
+    assert delta(before) == {"checkouts": 3, "connects": 1, "recycles": 0, "pings": 1, "invalidations": 0}
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+loadtest = pytest.importorskip("loadtest")
+
+from compliance_data import PREDEFINED_QA, search_handbook  # noqa: E402
+from search_index import build_search_bundle, get_handbook_index, query_terms  # noqa: E402
+
+CHAT_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "js", "chat.js")
+
+# Runs the offline search helpers of chat.js, which live between these two
+# functions, over a bundle and prints the local answer to every question
+RUNNER = """
+const fs = require('fs');
+const [bundlePath, questionsPath] = process.argv.slice(1);
+const searchBundle = JSON.parse(fs.readFileSync(bundlePath, 'utf8'));
+%s
+const questions = JSON.parse(fs.readFileSync(questionsPath, 'utf8'));
+console.log(JSON.stringify(questions.map(question => searchLocally(question))));
+"""
+
+
+def offline_answers(tmp_path, questions, **overrides):
+    with open(CHAT_JS) as f:
+        source = f.read()
+    helpers = source[source.index("    function bundleQueryTerms"):source.index("    function handleChatResponse")]
+    bundle_path, questions_path = tmp_path / "bundle.json", tmp_path / "questions.json"
+    bundle = dict(build_search_bundle(get_handbook_index(), PREDEFINED_QA), **overrides)
+    bundle_path.write_text(json.dumps(bundle))
+    questions_path.write_text(json.dumps(questions))
+    output = subprocess.run(["node", "-e", RUNNER % helpers, str(bundle_path), str(questions_path)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_offline_search_agrees_with_the_server(tmp_path):
+    answers = offline_answers(tmp_path, loadtest.QUESTIONS)
+    answered = 0
+    for question, local in zip(loadtest.QUESTIONS, answers):
+        if local is None:
+            # Questions the browser cannot answer confidently go to the server
+            continue
+        answered += 1
+        server = search_handbook(question)[0]
+        assert (local["sources"], local["answer"]) == (server.sources, server.answer), question
+    assert answered >= len(loadtest.QUESTIONS) // 2
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_offline_ranking_matches_the_server(tmp_path):
+    # Without the confidence gate the browser answers from its top ranked
+    # section, which must be the server's whenever both see the same terms
+    index = get_handbook_index()
+    questions = [question for question in loadtest.QUESTIONS
+                 if index.resolve_terms(question) == query_terms(question)]
+    for question, local in zip(questions, offline_answers(tmp_path, questions, min_coverage=0)):
+        server = search_handbook(question)[0]
+        assert local is not None, question
+        assert local["sources"] == server.sources, question
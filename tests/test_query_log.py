@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+import chat_service  # noqa: E402
+from query_log import QueryLog  # noqa: E402
+from question_cache import QuestionCache, question_cache  # noqa: E402
+
+NEW_QUESTION = "Do you run penetration tests?"
+NEW_ENTRY = ("default", QuestionCache.normalize(NEW_QUESTION))
+
+
+def query_log(tmp_path, **options):
+    return QueryLog(str(tmp_path / "query-log.sqlite3"), **options)
+
+
+def record(log, question, times):
+    for _ in range(times):
+        log.record(question)
+    log.flush()
+
+
+def test_new_questions_survive_a_full_log(tmp_path):
+    log = query_log(tmp_path, flush_interval=3600, max_entries=2)
+    record(log, "How are backups encrypted?", 50)
+    record(log, "Who reviews production access?", 40)
+
+    record(log, NEW_QUESTION, 1)
+    assert NEW_ENTRY in log.top(10)
+
+    # Still unpopular on a later flush, so it is trimmed
+    record(log, "How are backups encrypted?", 1)
+    assert NEW_ENTRY not in log.top(10)
+
+
+def test_old_counts_decay(tmp_path):
+    log = query_log(tmp_path, flush_interval=3600, max_entries=2, half_life=0.05)
+    record(log, "How are backups encrypted?", 50)
+    record(log, "Who reviews production access?", 40)
+    time.sleep(0.5)
+
+    # Ten half-lives later a handful of fresh questions outrank the old ones
+    record(log, NEW_QUESTION, 3)
+    record(log, NEW_QUESTION, 3)
+    assert log.top(1) == [NEW_ENTRY]
+
+
+def test_due_flush_runs_off_the_calling_thread(tmp_path, monkeypatch):
+    log = query_log(tmp_path, flush_interval=0)
+    flushed = threading.Event()
+    flushing_threads = []
+
+    def flush():
+        flushing_threads.append(threading.current_thread())
+        flushed.set()
+
+    monkeypatch.setattr(log, "flush", flush)
+    log.record("How are backups encrypted?")
+    assert flushed.wait(5)
+    assert flushing_threads[0] is not threading.current_thread()
+
+
+def test_warm_up_leaves_cache_stats_alone(monkeypatch):
+    monkeypatch.setattr(chat_service.query_log, "top", lambda limit: [])
+    before = question_cache.stats()
+    report = chat_service.warm_up(budget=60)
+    after = question_cache.stats()
+
+    assert report.preloaded == report.candidates > 0
+    assert (after["lookups"], after["hits"]) == (before["lookups"], before["hits"])
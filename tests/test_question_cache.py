@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+import chat_service  # noqa: E402
+from corpus_registry import TenantCorpus, corpus_registry  # noqa: E402
+from models import ChatMessage  # noqa: E402
+from question_cache import QuestionCache, question_cache  # noqa: E402
+from search_index import get_handbook_index  # noqa: E402
+
+
+def cached_answer(stored, asked):
+    index = get_handbook_index()
+    cache = QuestionCache(threshold=0.7)
+    answer = ChatMessage(question=stored, answer="stored answer", sources=["Handbook"])
+    cache.add(stored, answer, key_terms=index.resolve_terms(stored))
+    return cache.lookup(asked, key_terms=index.resolve_terms(asked))
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("Do you support SOC 2 Type II?", "Do you support SOC 1 Type II?"),
+    ("Are you ISO 27001 certified?", "Are you ISO 27701 certified?"),
+    ("Is data encrypted at rest?", "Is data not encrypted at rest?"),
+    ("Is customer data encrypted at rest?", "Isn't customer data encrypted at rest?"),
+    ("Are you SOC 2 Type II certified?", "Are you SOC 2 Type I certified?"),
+])
+def test_questions_differing_in_numbers_or_negation_are_not_reused(stored, asked):
+    assert cached_answer(stored, asked) is None
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("Do you encrypt data at rest?", "Is data encrypted at rest?"),
+    ("How do you handle incident response?", "How do you handle incident responses?"),
+    ("Do you support SOC 2 Type II?", "Do you support SOC 2 Type II?"),
+])
+def test_rephrased_questions_are_reused(stored, asked):
+    assert cached_answer(stored, asked).answer == "stored answer"
+
+
+def test_answers_are_cached_under_the_corpus_version_they_were_searched_in(monkeypatch):
+    question = "Which frameworks does the vendor risk review cover?"
+    searched = corpus_registry.get("default")
+    updated = TenantCorpus(searched.tenant_id, searched.shards, version="after-update")
+    search = chat_service.search_handbook
+
+    def search_during_update(*args, **kwargs):
+        results = search(*args, **kwargs)
+        # An admin update publishes a new corpus version while the search runs
+        monkeypatch.setattr(corpus_registry, "get", lambda tenant_id: updated)
+        return results
+
+    monkeypatch.setattr(chat_service, "search_handbook", search_during_update)
+    answer, cached = chat_service.answer_question(question)
+    key_terms = searched.resolve_terms(question)
+
+    assert answer is not None and not cached
+    assert question_cache.lookup(question, searched.cache_namespace, key_terms) is answer
+    assert question_cache.lookup(question, updated.cache_namespace, key_terms) is None
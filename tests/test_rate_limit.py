@@ -0,0 +1,28 @@
+from rate_limit import BucketSpec, ChatAdmissionController, TokenBucketStore
+
+
+def controller(tmp_path):
+    return ChatAdmissionController(
+        store=TokenBucketStore(str(tmp_path / "buckets.sqlite3")),
+        ip=BucketSpec(rate=1, burst=10),
+        user=BucketSpec(rate=3, burst=30),
+        anonymous_pool=BucketSpec(rate=20, burst=40),
+        authenticated_pool=BucketSpec(rate=20, burst=40),
+    )
+
+
+def test_cost_above_burst_is_oversized_not_retried(tmp_path):
+    admission = controller(tmp_path).admit("203.0.113.7", cost=11)
+    assert not admission.allowed
+    assert admission.oversized
+    assert admission.retry_after == 0
+
+
+def test_cost_within_burst_is_debited(tmp_path):
+    limiter = controller(tmp_path)
+    assert limiter.admit("203.0.113.7", cost=10).allowed
+    refused = limiter.admit("203.0.113.7", cost=1)
+    assert not refused.allowed and not refused.oversized
+    assert refused.retry_after >= 1
+    # Signed-in users draw from their own, larger budget
+    assert limiter.admit("203.0.113.7", user_id="42", cost=11).allowed
@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+
+def test_search_bundle_etag_differs_per_content_coding(client):
+    identity = client.get("/api/search-bundle", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/api/search-bundle", headers={"Accept-Encoding": "gzip"})
+
+    assert identity.status_code == gzipped.status_code == 200
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+
+    revalidated = client.get("/api/search-bundle", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+    # A validator for the other coding must not match this representation
+    mismatched = client.get("/api/search-bundle", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]})
+    assert mismatched.status_code == 200
+
+
+def sign_in(client, user_id, email, email_verified=True):
+    from app import db
+    from models import User
+
+    with client.application.app_context():
+        if db.session.get(User, user_id) is None:
+            db.session.add(User(id=user_id, email=email))
+            db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = user_id
+        session["_fresh"] = True
+        session["email_verified"] = email_verified
+
+
+def test_search_bundle_is_withheld_from_tenant_users(client):
+    import os
+    from corpus_registry import corpus_registry
+
+    os.makedirs(corpus_registry.tenant_dir("acme.example"), exist_ok=True)
+    sign_in(client, "tenant-user", "jane@acme.example")
+
+    response = client.get("/api/search-bundle")
+    assert response.status_code == 204
+    assert "no-store" in response.headers["Cache-Control"]
+
+
+def test_unverified_email_does_not_reach_the_tenant_corpus(client):
+    import os
+    from corpus_registry import corpus_registry
+
+    os.makedirs(corpus_registry.tenant_dir("acme.example"), exist_ok=True)
+    sign_in(client, "unverified-user", "mallory@acme.example", email_verified=False)
+
+    # Searches the built-in handbook, so the offline bundle is served
+    assert client.get("/api/search-bundle").status_code == 200
+
+
+@pytest.mark.parametrize("payload", [
+    {"delete": "Pricing"},
+    {"delete": [1, 2]},
+    {"upsert": {"title": "Pricing", "content": "Plans."}},
+    {"upsert": ["Pricing"]},
+    {"upsert": [{"title": "Pricing", "content": "Plans.", "subsections": "Tiers"}]},
+    {"upsert": [{"title": "Pricing", "content": "Plans.", "page_number": "two"}]},
+])
+def test_admin_section_update_rejects_malformed_payloads(client, monkeypatch, payload):
+    monkeypatch.setenv("ADMIN_API_TOKEN", "admin-token")
+    response = client.post("/admin/corpus/validation.example/handbook/sections", json=payload,
+                           headers={"Authorization": "Bearer admin-token"})
+    assert response.status_code == 400
+    assert response.json["success"] is False
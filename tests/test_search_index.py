@@ -0,0 +1,84 @@
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+from search_index import CORRECTION_WEIGHT, get_handbook_index  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def index():
+    return get_handbook_index()
+
+
+def section_titles(index, query, k=3):
+    ranked = index.top_sections(index.term_weights(query), k)
+    return [(index.sections[section_id].title, score) for section_id, score in ranked]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("What are the HIPPA requirements?", {"hipaa": CORRECTION_WEIGHT, "requirements": 1.0}),
+    ("How do you handle encyrption?", {"encryption": CORRECTION_WEIGHT}),
+    ("Are you ISO27001 certified?", {"iso": 1.0, "27001": 1.0, "certified": 1.0}),
+])
+def test_misspelled_and_glued_terms_resolve(index, query, expected):
+    assert index.term_weights(query) == expected
+
+
+@pytest.mark.parametrize("query, title", [
+    ("What are the HIPPA requirements?", "HIPAA Healthcare Compliance"),
+    ("How do you handle encyrption?", "Data Encryption and Security"),
+    ("Are you ISO27001 certified?", "ISO 27001 Information Security"),
+])
+def test_misspelled_queries_find_their_section(index, query, title):
+    assert section_titles(index, query)[0][0] == title
+
+
+@pytest.mark.parametrize("query", ["Do you support SSO?", "Do you support MFA?"])
+def test_exact_term_outranks_corrected_term(index, query):
+    # "support" is only reachable as a correction to "supports"
+    assert index.term_weights(query)["supports"] < 1.0
+    (best, best_score), (_, runner_up_score) = section_titles(index, query, 2)
+    assert best == "Access Control and Identity Management"
+    assert best_score > runner_up_score
+
+
+def brute_force_top_k(term_postings, k):
+    scores = {}
+    for ids, weight, _ in sorted(term_postings, key=lambda entry: -entry[2]):
+        for doc_id in ids:
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight(doc_id)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def random_term_postings(rng):
+    postings = []
+    for _ in range(rng.randint(1, 5)):
+        ids = sorted(rng.sample(range(30), rng.randint(1, 12)))
+        # Half-point weights make ties between ids common
+        weights = {doc_id: rng.randint(1, 4) / 2 for doc_id in ids}
+        postings.append((ids, weights.__getitem__, max(weights.values())))
+    return postings
+
+
+def test_top_k_matches_brute_force():
+    import random
+    from search_index import top_k
+
+    rng = random.Random(1234)
+    for _ in range(2000):
+        term_postings = random_term_postings(rng)
+        k = rng.randint(1, 10)
+        assert top_k(term_postings, k) == brute_force_top_k(term_postings, k)
+
+
+def test_top_k_pages_do_not_repeat_or_skip():
+    import random
+    from search_index import top_k
+
+    rng = random.Random(5678)
+    for _ in range(500):
+        term_postings = random_term_postings(rng)
+        k = rng.randint(1, 4)
+        pages = [top_k(term_postings, offset + k)[offset:] for offset in range(0, 30, k)]
+        ids = [doc_id for page in pages for doc_id, _ in page]
+        assert ids == [doc_id for doc_id, _ in brute_force_top_k(term_postings, 30)]